@@ -26,27 +26,44 @@ import urllib
 import urllib.parse
 import urllib.request
 import json
+import os
+import threading
+import collections
+import itertools
+import concurrent.futures
 from ArcRESTAPI.FeatureServices import *
 from ArcRESTAPI.Portal import *
+from HTTPTransport import JSONBackend
+from HTTPTransport.HTTPSession import default_session
+from ArcRESTAPI.TokenManager import TokenManager, request_json
 
 class AGOLHandler(object):
     """
     ArcGIS Online handler class:
-      -Generates and keeps tokens
+      -Generates and keeps tokens (renewed in the background before they expire)
       -Allows search of content
       -Creates Feature Service
       -Copy existing Feature Services
       -Adds/Deletes features from Feature Service
     """
 
-    def __init__(self, username, password, sourcePortal='https://www.arcgis.com'):
+    def __init__(self, username, password, sourcePortal='https://www.arcgis.com', session=None,
+                 token_refresh_margin=300, auto_refresh_token=True, count_ttl=0):
         self.username = username
         self.password = password
         self.sourcePortal = sourcePortal
-        self.handler_token, self.http, self.expires = self.get_token()
-        self._portal = self.get_portal_info()
-        self._user_info = self.get_user_info()
-        self._user_items = self.get_user_content()
+        # keep-alive connection pool, can be shared with a GooglePlaces instance
+        self._session = session if session is not None else default_session()
+        # count_ttl: seconds the feature servers and layers built for this handler cache count() results
+        self._count_ttl = count_ttl
+        # token_refresh_margin: seconds before expiry the token is renewed (on a background timer if auto_refresh_token)
+        self._token_manager = TokenManager(self._fetch_token, refresh_margin=token_refresh_margin,
+                                           auto_refresh=auto_refresh_token)
+        # bad credentials or an unreachable portal fail here instead of on the first request
+        self._token_manager.refresh(raise_on_failure=True)
+        # portal/user info and content are requested on first access, see refresh_info
+        self._loaded = {}
+        self._loaded_lock = threading.RLock()
 
     def get_token(self, exp=60):  # expires in 60 minutes
         parameters = urllib.parse.urlencode({'username': self.username,
@@ -56,7 +73,7 @@ class AGOLHandler(object):
                                              'expiration': exp,
                                              'f': 'json'}).encode("utf-8")
         request = self.sourcePortal + '/sharing/rest/generateToken?'
-        json_response = json.loads(urllib.request.urlopen(request, parameters).read().decode("utf-8"))
+        json_response = JSONBackend.loads(self.session.urlopen(request, parameters).read())
         try:
             if 'token' in json_response:
                 return json_response['token'], request, json_response['expires']
@@ -68,25 +85,39 @@ class AGOLHandler(object):
             print('An unspecified error occurred.')
             print(e)
 
+    def _fetch_token(self):
+        """(token, expires) for the TokenManager; uses the blocking get_token even on subclasses"""
+        result = AGOLHandler.get_token(self)
+        if result:
+            return result[0], result[2]
+
+    def __post_json(self, request, parameters):
+        """
+        POSTs parameters with the current token, retrying once with a new token if it was rejected. Private so
+        the blocking methods keep using it on subclasses that post asynchronously (AsyncAGOLHandler).
+        """
+        return request_json(self.session, request, parameters, self._token_manager)
+
+    def close(self):
+        """Stops the background token refresh."""
+        self._token_manager.close()
+
     def get_info(self):
         '''Returns the description for a Portal for ArcGIS item.'''
-        parameters = urllib.parse.urlencode({'token': self.token, 'f': 'json'}).encode("utf-8")
         request = self.sourcePortal + '/sharing/rest/content/items?'
-        json_response = json.loads(urllib.request.urlopen(request, parameters).read().decode("utf-8"))
+        json_response = self.__post_json(request, {'f': 'json'})
         return json_response
 
     def get_portal_info(self):
         '''Returns the description for a Portal for ArcGIS item.'''
-        parameters = urllib.parse.urlencode({'token': self.token, 'f': 'json'}).encode("utf-8")
         request = self.sourcePortal + '/sharing/rest/portals/self?'
-        json_response = json.loads(urllib.request.urlopen(request, parameters).read().decode("utf-8"))
+        json_response = self.__post_json(request, {'f': 'json'})
         return Portal(json_response)
 
     def get_user_info(self):
         '''Returns the description for a Portal for ArcGIS item.'''
-        parameters = urllib.parse.urlencode({'token': self.token, 'f': 'pjson'}).encode("utf-8")
         request = self.sourcePortal + '/sharing/rest/content/users/' + self.username + '?'
-        json_response = json.loads(urllib.request.urlopen(request, parameters).read().decode("utf-8"))
+        json_response = self.__post_json(request, {'f': 'pjson'})
         return json_response
 
     def search(self, query=None, numResults=100, sortField='numviews', sortOrder='desc', start=0, token=None):
@@ -101,7 +132,7 @@ class AGOLHandler(object):
             parameters['token'] = token
         parameters = urllib.parse.urlencode(parameters).encode("utf-8")
         request = self.sourcePortal + '/sharing/rest/search?'
-        json_response = json.loads(urllib.request.urlopen(request, parameters).read().decode("utf-8"))
+        json_response = JSONBackend.loads(self.session.urlopen(request, parameters).read())
         print(json_response)
         if len(json_response['results']) > 1:
             return AGOLItems(self, json_response['results']).results
@@ -110,36 +141,97 @@ class AGOLHandler(object):
         else:
             print("Appears to be no results..")
 
-    def get_user_content(self):
-        parameters = urllib.parse.urlencode({'token': self.token, 'f': 'json'}).encode("utf-8")
+    def search_iter(self, query=None, page_size=100, max_results=None, prefetch=4, sortField='numviews',
+                    sortOrder='desc', token=None):
+        '''
+        Yields an AGOLItem for every search result, following nextStart through all pages. Once the first page
+        reports the total, up to prefetch further pages are requested concurrently while the current one is
+        consumed. page_size is capped at 100, the portal's maximum.
+        '''
+        request = self.sourcePortal + '/sharing/rest/search?'
+        page_size = max(1, min(page_size, 100))
+        parameters = {'q': query,
+                      'num': page_size,
+                      'sortField': sortField,
+                      'sortOrder': sortOrder,
+                      'f': 'json'}
+        if token:
+            parameters['token'] = token
+
+        def fetch(start):
+            return request_json(self.session, request, dict(parameters, start=start))
+
+        yielded = 0
+        json_response = fetch(1)
+        total = json_response.get('total')
+        next_start = json_response.get('nextStart', -1)
+        if prefetch and isinstance(total, int) and isinstance(next_start, int) and next_start > 1:
+            last = total if max_results is None else min(total, max_results)
+            starts = iter(range(next_start, last + 1, page_size))
+            with concurrent.futures.ThreadPoolExecutor(max_workers=prefetch) as executor:
+                pending = collections.deque(executor.submit(fetch, start) for start in itertools.islice(starts, prefetch))
+                while True:
+                    for json_item in json_response.get('results', []):
+                        if max_results is not None and yielded >= max_results:
+                            for future in pending: future.cancel()
+                            return
+                        yielded += 1
+                        yield AGOLItem(self, json_item)
+                    if not pending:
+                        return
+                    json_response = pending.popleft().result()
+                    pending.extend(executor.submit(fetch, start) for start in itertools.islice(starts, 1))
+        while True:
+            for json_item in json_response.get('results', []):
+                if max_results is not None and yielded >= max_results:
+                    return
+                yielded += 1
+                yield AGOLItem(self, json_item)
+            start = json_response.get('nextStart', -1)
+            if not isinstance(start, int) or start < 1 or not json_response.get('results'):
+                return
+            json_response = fetch(start)
+
+    def get_user_content(self, num=100):
+        return list(self.iter_user_content(num))
+
+    def iter_user_content(self, num=100):
+        '''Yields an AGOLItem for every item of the user, requesting num items per page (nextStart paging).'''
         request = self.sourcePortal + '/sharing/rest/content/users/' + self.username + '?'
-        json_response = json.loads(urllib.request.urlopen(request, parameters).read().decode("utf-8"))
-        #return json_response
-        return AGOLItems(self, json_response['items']).results
+        start = 1
+        while True:
+            json_response = self.__post_json(request, {'f': 'json', 'start': start, 'num': num})
+            for json_item in json_response.get('items', []):
+                yield AGOLItem(self, json_item)
+            next_start = json_response.get('nextStart', -1)
+            if not isinstance(next_start, int) or next_start <= start:
+                return
+            start = next_start
 
     def get_item_description(self, item_id):
         '''Returns the description for a Portal for ArcGIS item.'''
-        parameters = urllib.parse.urlencode({'token': self.token, 'f': 'json'}).encode("utf-8")
         request = self.sourcePortal + '/sharing/rest/content/items/' + item_id + '?'
-        json_response = json.loads(urllib.request.urlopen(request, parameters).read().decode("utf-8"))
+        json_response = self.__post_json(request, {'f': 'json'})
         return json_response
 
     def get_itemdata(self, item_id):
         '''Returns the description for a Portal for ArcGIS item.'''
-        parameters = urllib.parse.urlencode({'token': self.token, 'f': 'json'}).encode("utf-8")
         request = self.sourcePortal + '/sharing/rest/content/items/' + item_id + '/data?'
-        json_response = json.loads(urllib.request.urlopen(request, parameters).read().decode("utf-8"))
+        json_response = self.__post_json(request, {'f': 'json'})
         return json_response
 
-    def delete_features(self, service_url, layer_id=0, where='ObjectId>0'):
+    def delete_features(self, service_url, layer_id=0, where='ObjectId>0', chunked=False, max_workers=4):
         '''Returns the description for a Portal for ArcGIS item.
-        http://resources.arcgis.com/en/help/arcgis-rest-api/#/Delete_Features/02r3000000w4000000/'''
-        parameters = urllib.parse.urlencode({'where': where,
-                                             'f': 'json',
-                                             'token': self.token}).encode("utf-8")
+        http://resources.arcgis.com/en/help/arcgis-rest-api/#/Delete_Features/02r3000000w4000000/
+        chunked deletes by objectId in batches, see AGOLFeatureServerLayer.delete_features.'''
+        if chunked:
+            layer = AGOLFeatureServerLayer(service_url + '/{}'.format(str(layer_id)), self, session=self.session)
+            return layer.delete_features(where, chunked=True, max_workers=max_workers)
+        parameters = {'where': where,
+                      'f': 'json'}
         request = service_url + '/{}/deleteFeatures?'.format(str(layer_id))
         try:
-            json_response = json.loads(urllib.request.urlopen(request, parameters).read().decode("utf-8"))
+            json_response = self.__post_json(request, parameters)
             if 'deleteResults' in json_response:
                 return json_response
             elif 'error' in json_response:
@@ -154,14 +246,13 @@ class AGOLHandler(object):
     def add_features(self, service_url, agol_json, layer_id=0):
         '''Returns the description for a Portal for ArcGIS item.
         http://resources.arcgis.com/en/help/arcgis-rest-api/#/Add_Features/02r30000010m000000/'''
-        parameters = urllib.parse.urlencode({'features': agol_json,
-                                             'f': 'json',
-                                             'token': self.token}).encode("utf-8")
+        parameters = {'features': agol_json,
+                      'f': 'json'}
         request = service_url + '/{}/addFeatures?'.format(str(layer_id))
         print(request)
         try:
-            json_response = json.loads(urllib.request.urlopen(request, parameters).read().decode("utf-8"))
-            if 'deleteResults' in json_response:
+            json_response = self.__post_json(request, parameters)
+            if 'addResults' in json_response:
                 return json_response
             elif 'error' in json_response:
                 print(json_response['error']['code'])
@@ -172,29 +263,79 @@ class AGOLHandler(object):
             print('An unspecified error occurred.')
             print(e)
 
-    def copy_feature_server(self, feature_server_url, feature_server_name):
-        copied_feature_server = AGOLFeatureServer(feature_server_url, feature_server_name)
-        print(copied_feature_server.layers)
-        for layer in copied_feature_server.layers:
-            print(layer.service_definition)
-        new_feature_server = self.__create_feature_service(copied_feature_server.createParameters_template, feature_server_name)
-        new_feature_server = new_feature_server.add_layers(copied_feature_server.layers)
+    def add_features_bulk(self, service_url, features, layer_id=0, chunk_size=None, max_workers=4, max_retries=3):
+        """Chunked, parallel addFeatures, see AGOLFeatureServerLayer.add_features_bulk."""
+        layer = AGOLFeatureServerLayer(service_url + '/{}'.format(str(layer_id)), self, session=self.session)
+        return layer.add_features_bulk(features, chunk_size=chunk_size, max_workers=max_workers,
+                                       max_retries=max_retries)
+
+    def copy_feature_server(self, feature_server_url, feature_server_name, copy_data=True, checkpoint_file=None,
+                            max_layers=2, max_workers=4):
+        """
+        Creates feature_server_name with the schema of feature_server_url (layers and tables) and, with
+        copy_data, copies the features and table rows into it (see copy_features). If checkpoint_file holds an interrupted copy, the
+        target service recorded there is reused and the copy resumes instead of starting over.
+        """
+        copied_feature_server = AGOLFeatureServer(feature_server_url, feature_server_name, agol_handler=self)
+        target_url = None
+        if checkpoint_file and os.path.exists(checkpoint_file):
+            with open(checkpoint_file) as infile:
+                target_url = JSONBackend.loads(infile.read()).get('target')
+        if target_url:
+            new_feature_server = AGOLFeatureServer(target_url, feature_server_name, agol_handler=self)
+        else:
+            for layer in copied_feature_server.layers + copied_feature_server.tables:
+                print(layer.service_definition)
+            new_feature_server = self.__create_feature_service(copied_feature_server.createParameters_template, feature_server_name)
+            if new_feature_server is None:
+                return None
+            new_feature_server = new_feature_server.add_layers(copied_feature_server.layers,
+                                                               copied_feature_server.tables)
+        if copy_data:
+            results = self.copy_features(feature_server_url, new_feature_server.url, checkpoint_file=checkpoint_file,
+                                         layer_ids=[layer.layer_id for layer in
+                                                    copied_feature_server.layers + copied_feature_server.tables],
+                                         max_layers=max_layers, max_workers=max_workers)
+            for layer_id, result in sorted(results.items()):
+                print('Layer {}: {} features added, {} rejected{}'.format(
+                    layer_id, result['added'], result['failed'],
+                    '' if result['error'] is None else ', stopped: ' + result['error']))
         return new_feature_server
 
-    def write_jsonfile(self, returned_json, filename='\json_file'):
+    def copy_features(self, source_url, target_url, checkpoint_file=None, layer_ids=None, **kwargs):
+        """
+        Copies the features of the source feature server's layers into the layers with the same ids of
+        target_url. Keyword arguments (where, max_layers, max_workers, page_size, chunk_size, max_retries,
+        backoff) go to FeatureServerCopy; returns its per layer results.
+        """
+        # imported here, FeatureServerCopy imports FeatureServices which star-imports this module
+        from ArcRESTAPI.FeatureServerCopy import FeatureServerCopy
+        copy = FeatureServerCopy(source_url, target_url, agol_handler=self, checkpoint_file=checkpoint_file, **kwargs)
+        return copy.run(layer_ids)
+
+    def sync_features(self, layer_url, features, key_field='place_id', dry_run=False, **kwargs):
+        """
+        Brings the layer at layer_url in line with features (ArcREST features, an AGOL_JSON or a
+        GooglePlacesSearchResult) by sending only the adds, updates and deletes keyed on key_field.
+        Keyword arguments go to FeatureLayerSync; returns its summary.
+        """
+        from ArcRESTAPI.FeatureLayerSync import FeatureLayerSync
+        layer = AGOLFeatureServerLayer(layer_url, self, session=self.session)
+        return FeatureLayerSync(layer, key_field=key_field, **kwargs).sync(features, dry_run=dry_run)
+
+    def write_jsonfile(self, returned_json, filename='\json_file', compact=False):
         print(returned_json)
         with open(filename + '.json', 'w') as outfile:
-            json.dump(returned_json, outfile, sort_keys=False, indent=4, ensure_ascii=False)
+            JSONBackend.dump(returned_json, outfile, indent=None if compact else 4)
 
     def __create_feature_service(self, create_parameters, feature_server_name):
         user_content_url = self.sourcePortal + "/sharing/rest/content/users/" + self.username
-        parameters = urllib.parse.urlencode({"createParameters": create_parameters,
-                                             "outputType": "featureService",
-                                             "f": "json",
-                                             "token": self.token}).encode("utf-8")
+        parameters = {"createParameters": create_parameters,
+                      "outputType": "featureService",
+                      "f": "json"}
         create_service_request = user_content_url + '/createService?'
         print(create_service_request)
-        json_response = json.loads(urllib.request.urlopen(create_service_request, parameters).read().decode("utf-8"))
+        json_response = self.__post_json(create_service_request, parameters)
         print(json_response)
         if 'error' not in json_response:
             return AGOLFeatureServer(json_response['serviceurl'], feature_server_name, agol_handler=self)
@@ -211,21 +352,63 @@ class AGOLHandler(object):
     def __add_features(self, layer):
         pass
 
+    def _lazy(self, name, loader):
+        with self._loaded_lock:
+            if name not in self._loaded:
+                self._loaded[name] = loader()
+            return self._loaded[name]
+
+    def refresh_info(self, *names):
+        """Drops the cached 'info', 'portal', 'user_info' and/or 'user_items' (all by default) so the next
+        access requests them again."""
+        with self._loaded_lock:
+            for name in names or list(self._loaded):
+                self._loaded.pop(name, None)
+
     @property
     def info(self):
-        return self._info
+        return self._lazy('info', self.get_info)
 
     @property
     def portal(self):
-        return self._portal
+        return self._lazy('portal', self.get_portal_info)
+
+    @property
+    def user_info(self):
+        return self._lazy('user_info', self.get_user_info)
 
     @property
     def user_items(self):
-        return self._user_items
+        return self._lazy('user_items', self.get_user_content)
 
     @property
     def token(self):
-        return self.handler_token
+        return self._token_manager.token
+
+    @property
+    def handler_token(self):
+        return self._token_manager.token
+
+    @property
+    def expires(self):
+        """token expiry in epoch milliseconds, as returned by generateToken"""
+        return self._token_manager.expires * 1000 if self._token_manager.expires is not None else None
+
+    @property
+    def http(self):
+        return self.sourcePortal + '/sharing/rest/generateToken?'
+
+    @property
+    def token_manager(self):
+        return self._token_manager
+
+    @property
+    def session(self):
+        return self._session
+
+    @property
+    def count_ttl(self):
+        return self._count_ttl
 
 class AGOLError(object):
 
@@ -0,0 +1,250 @@
+"""
+COPYRIGHT 2016 ESRI
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>
+"""
+__author__='joelwhitney'
+"""
+  Requires Python 3.5+
+  A simple wrapper around the ArcREST API to make my life easier.... maybe.
+
+  The AsyncAGOLHandler.py helper class is the asyncio version of AGOLHandler:
+  same methods, as coroutines, sent through an AsyncHTTPSession so one event
+  loop can keep many AGOL requests in flight.
+"""
+import asyncio
+import threading
+import urllib
+import urllib.parse
+from ArcRESTAPI.AGOLHandler import *
+from HTTPTransport import JSONBackend
+from HTTPTransport.AsyncHTTPSession import AsyncHTTPSession
+from HTTPTransport.HTTPSession import default_session
+from ArcRESTAPI.TokenManager import TokenManager, TokenError, is_token_error
+
+class AsyncAGOLHandler(AGOLHandler):
+    """
+    Asyncio ArcGIS Online handler class. Construction makes no requests; await
+    initialize() (or use 'async with') to generate the token. The info, portal,
+    user_info and user_items properties are filled by awaiting load_info()
+    (or initialize(load_info=True)); reading them before that raises
+    RuntimeError, as they cannot be loaded lazily without blocking the loop.
+    """
+
+    def __init__(self, username, password, sourcePortal='https://www.arcgis.com', async_session=None,
+                 session=None, max_concurrency=100, token_refresh_margin=300, auto_refresh_token=True,
+                 count_ttl=0):
+        self.username = username
+        self.password = password
+        self.sourcePortal = sourcePortal
+        # blocking helpers (AGOLFeatureServer, copy_feature_server) use the synchronous session
+        self._session = session if session is not None else default_session()
+        self._async_session = async_session if async_session is not None else AsyncHTTPSession(max_concurrency=max_concurrency)
+        self._count_ttl = count_ttl
+        # the background refresh (a timer thread) goes through the blocking get_token and the synchronous session
+        self._token_manager = TokenManager(self._fetch_token, refresh_margin=token_refresh_margin,
+                                           auto_refresh=auto_refresh_token)
+        self._loaded = {}
+        self._loaded_lock = threading.RLock()
+
+    async def initialize(self, load_info=False):
+        await self._refresh_token()
+        if self._token_manager.current_token is None:
+            raise TokenError('generateToken did not return a token')
+        if load_info:
+            await self.load_info()
+        return self
+
+    async def load_info(self):
+        """Requests the info, portal, user info and user content concurrently and caches them."""
+        info, portal, user_info, user_items = await asyncio.gather(self.get_info(),
+                                                                   self.get_portal_info(),
+                                                                   self.get_user_info(),
+                                                                   self.get_user_content())
+        with self._loaded_lock:
+            self._loaded.update(info=info, portal=portal, user_info=user_info, user_items=user_items)
+
+    def _lazy(self, name, loader):
+        # the loaders are coroutines here, so nothing is loaded on access
+        with self._loaded_lock:
+            if name not in self._loaded:
+                raise RuntimeError('{} is not loaded, await load_info() first'.format(name))
+            return self._loaded[name]
+
+    async def __aenter__(self):
+        return await self.initialize()
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+    async def close(self):
+        self._token_manager.close()
+        await self.async_session.close()
+
+    async def _refresh_token(self, rejected_token=None):
+        # another coroutine may already have replaced the rejected token
+        if rejected_token is not None and rejected_token != self._token_manager.current_token:
+            return
+        result = await self.get_token()
+        if result:
+            self._token_manager.set(result[0], result[2])
+
+    async def _post_json(self, request, parameters, with_token=True):
+        """
+        POSTs the parameters dict, with the current token unless with_token is False. An expired token is
+        renewed first, and a request rejected for its token is retried once with a new one.
+        """
+        for attempt in range(2):
+            request_parameters = dict(parameters)
+            token = None
+            if with_token:
+                if self._token_manager.needs_refresh(0):
+                    await self._refresh_token()
+                token = self._token_manager.current_token
+                if token: request_parameters['token'] = token
+            data = urllib.parse.urlencode(request_parameters).encode("utf-8")
+            response = await self.async_session.urlopen(request, data)
+            json_response = JSONBackend.loads(response.read())
+            if not with_token or attempt or not is_token_error(json_response):
+                return json_response
+            await self._refresh_token(token)
+        return json_response
+
+    async def get_token(self, exp=60):  # expires in 60 minutes
+        parameters = {'username': self.username,
+                      'password': self.password,
+                      'client': 'referer',
+                      'referer': self.sourcePortal,
+                      'expiration': exp,
+                      'f': 'json'}
+        request = self.sourcePortal + '/sharing/rest/generateToken?'
+        json_response = await self._post_json(request, parameters, with_token=False)
+        try:
+            if 'token' in json_response:
+                return json_response['token'], request, json_response['expires']
+            elif 'error' in json_response:
+                print(json_response['error']['message'])
+                for detail in json_response['error']['details']:
+                    print(detail)
+        except ValueError as e:
+            print('An unspecified error occurred.')
+            print(e)
+
+    async def get_info(self):
+        request = self.sourcePortal + '/sharing/rest/content/items?'
+        return await self._post_json(request, {'f': 'json'})
+
+    async def get_portal_info(self):
+        request = self.sourcePortal + '/sharing/rest/portals/self?'
+        return Portal(await self._post_json(request, {'f': 'json'}))
+
+    async def get_user_info(self):
+        request = self.sourcePortal + '/sharing/rest/content/users/' + self.username + '?'
+        return await self._post_json(request, {'f': 'pjson'})
+
+    async def search(self, query=None, numResults=100, sortField='numviews', sortOrder='desc', start=0, token=None):
+        '''Retrieve a single page of search results.'''
+        parameters = {'q': query,
+                      'num': numResults,
+                      'sortField': sortField,
+                      'sortOrder': sortOrder,
+                      'f': 'json',
+                      'start': start}
+        if token:
+            parameters['token'] = token
+        request = self.sourcePortal + '/sharing/rest/search?'
+        json_response = await self._post_json(request, parameters, with_token=False)
+        if len(json_response['results']) > 1:
+            return AGOLItems(self, json_response['results']).results
+        elif len(json_response['results']) == 1:
+            return AGOLItem(self, json_response['results'][0])
+        else:
+            print("Appears to be no results..")
+
+    async def get_user_content(self, num=100):
+        return [item async for item in self.iter_user_content(num)]
+
+    async def iter_user_content(self, num=100):
+        '''Async generator of an AGOLItem for every item of the user, requesting num items per page.'''
+        request = self.sourcePortal + '/sharing/rest/content/users/' + self.username + '?'
+        start = 1
+        while True:
+            json_response = await self._post_json(request, {'f': 'json', 'start': start, 'num': num})
+            for json_item in json_response.get('items', []):
+                yield AGOLItem(self, json_item)
+            next_start = json_response.get('nextStart', -1)
+            if not isinstance(next_start, int) or next_start <= start:
+                return
+            start = next_start
+
+    async def get_item_description(self, item_id):
+        request = self.sourcePortal + '/sharing/rest/content/items/' + item_id + '?'
+        return await self._post_json(request, {'f': 'json'})
+
+    async def get_itemdata(self, item_id):
+        request = self.sourcePortal + '/sharing/rest/content/items/' + item_id + '/data?'
+        return await self._post_json(request, {'f': 'json'})
+
+    async def delete_features(self, service_url, layer_id=0, where='ObjectId>0'):
+        '''http://resources.arcgis.com/en/help/arcgis-rest-api/#/Delete_Features/02r3000000w4000000/'''
+        parameters = {'where': where,
+                      'f': 'json'}
+        request = service_url + '/{}/deleteFeatures?'.format(str(layer_id))
+        try:
+            json_response = await self._post_json(request, parameters)
+            if 'deleteResults' in json_response:
+                return json_response
+            elif 'error' in json_response:
+                print(json_response['error']['code'])
+                print(json_response['error']['message'])
+                for detail in json_response['error']['details']:
+                    print(detail)
+        except ValueError as e:
+            print('An unspecified error occurred.')
+            print(e)
+
+    async def add_features(self, service_url, agol_json, layer_id=0):
+        '''http://resources.arcgis.com/en/help/arcgis-rest-api/#/Add_Features/02r30000010m000000/'''
+        parameters = {'features': agol_json,
+                      'f': 'json'}
+        request = service_url + '/{}/addFeatures?'.format(str(layer_id))
+        try:
+            json_response = await self._post_json(request, parameters)
+            if 'addResults' in json_response:
+                return json_response
+            elif 'error' in json_response:
+                print(json_response['error']['code'])
+                print(json_response['error']['message'])
+                for detail in json_response['error']['details']:
+                    print(detail)
+        except ValueError as e:
+            print('An unspecified error occurred.')
+            print(e)
+
+    async def copy_feature_server(self, feature_server_url, feature_server_name):
+        # add_layers reads the portal id, which cannot be loaded lazily from the executor thread
+        with self._loaded_lock:
+            has_portal = 'portal' in self._loaded
+        if not has_portal:
+            portal = await self.get_portal_info()
+            with self._loaded_lock:
+                self._loaded.setdefault('portal', portal)
+        # the schema copy is a handful of dependent blocking calls, run it off the event loop
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, AGOLHandler.copy_feature_server, self,
+                                          feature_server_url, feature_server_name)
+
+    @property
+    def async_session(self):
+        return self._async_session
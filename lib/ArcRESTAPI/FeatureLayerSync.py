@@ -0,0 +1,218 @@
+"""
+COPYRIGHT 2016 ESRI
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>
+"""
+__author__='joelwhitney'
+"""
+  Requires Python 3+
+  A simple wrapper around the ArcREST API to make my life easier.... maybe.
+
+  The FeatureLayerSync.py class keeps a hosted feature layer in step with a
+  fresh set of features (e.g. a GooglePlacesSearchResult's AGOL_JSON) keyed
+  by a unique field such as place_id. The layer is indexed by that key, the
+  differences become adds, updates and deletes and only those are sent, in
+  batches through applyEdits, instead of deleting and re-adding every row.
+"""
+import math
+
+# meters per degree at the equator, to move a tolerance between geographic and projected units
+METERS_PER_DEGREE = 111319.49
+# tolerances used when the layer does not report an xyTolerance
+DEFAULT_XY_TOLERANCE = {'projected': 0.001, 'geographic': 8.983152841195215e-09}
+
+
+def _arcrest_features(features):
+    """ArcREST feature dicts from an iterable of them, an AGOL_JSON or a result with an agol_json property"""
+    if hasattr(features, 'agol_json'):
+        features = features.agol_json
+    if hasattr(features, 'iter_arcrest_features'):
+        return features.iter_arcrest_features()
+    return features
+
+def _incomplete_source(features):
+    """True when a search result reports areas it could not search (e.g. AreaSearchResult's failed tiles)"""
+    coverage = getattr(features, 'coverage', None)
+    return isinstance(coverage, dict) and coverage.get('tiles_failed', 0) > 0
+
+def _is_missing(value):
+    # AGOL_JSON writes missing values as 'none' (str(None) for the rating), the layer stores null
+    return value is None or (isinstance(value, str) and value.lower() == 'none')
+
+def _is_geographic(wkid):
+    return wkid is not None and 4000 <= wkid < 5000
+
+def _same_value(old, new, tolerance):
+    if old == new:
+        return True
+    if _is_missing(old) or _is_missing(new):
+        return _is_missing(old) and _is_missing(new)
+    try:
+        return math.isclose(float(old), float(new), rel_tol=0, abs_tol=tolerance)
+    except (TypeError, ValueError):
+        # the layer may store a value as text (or a flag as 0/1) that the source holds as a number/bool
+        return str(old).lower() == str(new).lower()
+
+def _same_geometry(old, new, tolerance):
+    if not old or not new:
+        return not old and not new
+    return all(_same_value(old.get(key), new.get(key), tolerance) for key in ('x', 'y'))
+
+
+class FeatureLayerSync(object):
+    """
+    Diff based sync of an AGOLFeatureServerLayer against a new set of features.
+
+    Features are matched on key_field. A new key is an add, a key whose attributes (numbers beyond
+    tolerance) or point geometry changed is an update and a key that is no longer present is a delete (unless
+    delete_missing is False); unchanged features are not sent at all. Places a search result left out
+    because their details failed (details_errors) are never deleted, and when the result reports failed
+    search tiles no missing key is deleted unless delete_incomplete is set. Only attributes the layer has are
+    compared, and null equals 'none'. Points are compared with geometry_tolerance, by default the layer's
+    xyTolerance converted to the units of the incoming features, so the server's coordinate snapping does
+    not count as a change. The edits go through the layer's apply_edits, batch_size
+    edits per request (default: the layer's maxRecordCount), max_workers requests at a time.
+    """
+    def __init__(self, layer, key_field='place_id', where='1=1', delete_missing=True, tolerance=1e-7,
+                 geometry_tolerance=None, batch_size=None, max_workers=4, max_retries=3, backoff=1.0,
+                 delete_incomplete=False):
+        self._layer = layer
+        self._key_field = key_field
+        self._where = where
+        self._delete_missing = delete_missing
+        self._delete_incomplete = delete_incomplete
+        self._tolerance = tolerance
+        self._geometry_tolerance = geometry_tolerance
+        self._batch_size = batch_size
+        self._max_workers = max_workers
+        self._max_retries = max_retries
+        self._backoff = backoff
+
+    def diff(self, features):
+        """
+        Returns {'adds': [...], 'updates': [...], 'deletes': [objectIds], 'unchanged': n, 'incomplete': bool}
+        for the features (ArcREST feature dicts, an AGOL_JSON or a GooglePlacesSearchResult). Features without
+        a key and repeated keys are skipped; duplicate keys already in the layer are deleted. 'incomplete'
+        reports a source whose missing keys were not deleted because part of it failed.
+        """
+        incoming = {}
+        fields = set()
+        spatial_reference = None
+        for feature in _arcrest_features(features):
+            key = feature['attributes'].get(self._key_field)
+            if key is None or key in incoming:
+                continue
+            incoming[key] = feature
+            fields.update(feature['attributes'])
+            if spatial_reference is None and feature.get('geometry'):
+                spatial_reference = feature['geometry'].get('spatialReference')
+        # read after the features were consumed, a lazy result only knows its failures then
+        failed_keys = set(getattr(features, 'details_errors', None) or ())
+        incomplete = _incomplete_source(features) or (bool(failed_keys) and self._key_field != 'place_id')
+        delete_missing = self._delete_missing and (self._delete_incomplete or not incomplete)
+        if incomplete and self._delete_missing and not delete_missing:
+            print('The source is incomplete, features missing from it are not deleted (see delete_incomplete)')
+        object_id_field = self._layer.object_id_field
+        fields.update((self._key_field, object_id_field))
+        layer_fields = dict((field['name'].lower(), field['name'])
+                            for field in self._layer.service_definition.get('fields') or [] if 'name' in field)
+        if layer_fields:
+            # field names are case insensitive; incoming fields the layer lacks are neither read nor compared
+            fields = set(layer_fields[field.lower()] for field in fields if field.lower() in layer_fields)
+        self._compared_fields = dict((field.lower(), field) for field in fields if field != object_id_field)
+        out_sr = (spatial_reference or {}).get('wkid')
+        self._xy_tolerance = self.__geometry_tolerance(out_sr)
+        adds, updates, deletes = [], [], []
+        matched = set()
+        for existing in self._layer.query_iter(where=self._where, fields=','.join(sorted(fields)), out_sr=out_sr):
+            attributes = existing['attributes']
+            key = attributes.get(self._key_field)
+            object_id = attributes[object_id_field]
+            if key not in incoming or key in matched:
+                if key in matched or (delete_missing and key not in failed_keys):
+                    deletes.append(object_id)
+                continue
+            matched.add(key)
+            feature = incoming[key]
+            if not self.__changed(existing, feature):
+                continue
+            update_attributes = dict(feature['attributes'])
+            update_attributes[object_id_field] = object_id
+            updates.append(dict(feature, attributes=update_attributes))
+        for key, feature in incoming.items():
+            if key not in matched:
+                adds.append(feature)
+        return {'adds': adds, 'updates': updates, 'deletes': deletes, 'unchanged': len(matched) - len(updates),
+                'incomplete': incomplete}
+
+    def __geometry_tolerance(self, out_sr):
+        """geometry_tolerance, or the layer's xyTolerance in the units of out_sr"""
+        if self._geometry_tolerance is not None:
+            return self._geometry_tolerance
+        service_definition = self._layer.service_definition
+        spatial_reference = ((service_definition.get('extent') or {}).get('spatialReference') or
+                             service_definition.get('sourceSpatialReference') or
+                             service_definition.get('spatialReference') or {})
+        if not isinstance(spatial_reference, dict):
+            spatial_reference = {}
+        layer_wkid = spatial_reference.get('latestWkid') or spatial_reference.get('wkid')
+        layer_geographic = _is_geographic(layer_wkid)
+        xy_tolerance = spatial_reference.get('xyTolerance')
+        if not isinstance(xy_tolerance, (int, float)) or xy_tolerance <= 0:
+            xy_tolerance = DEFAULT_XY_TOLERANCE['geographic' if layer_geographic else 'projected']
+        out_geographic = _is_geographic(out_sr) if out_sr is not None else layer_geographic
+        if layer_geographic and not out_geographic:
+            return xy_tolerance * METERS_PER_DEGREE
+        if out_geographic and not layer_geographic:
+            return xy_tolerance / METERS_PER_DEGREE
+        return xy_tolerance
+
+    def __changed(self, existing, feature):
+        attributes = existing['attributes']
+        for field, value in feature['attributes'].items():
+            layer_field = self._compared_fields.get(field.lower())
+            if layer_field is None:
+                continue
+            if not _same_value(attributes.get(layer_field), value, self._tolerance):
+                return True
+        return 'geometry' in feature and not _same_geometry(existing.get('geometry'), feature['geometry'],
+                                                             self._xy_tolerance)
+
+    def apply(self, edits):
+        """
+        Sends a diff() result with the layer's apply_edits. Returns the counts of 'adds', 'updates' and
+        'deletes' the server accepted, 'unchanged', 'incomplete', 'failedChunks' and 'errors' (one per failed
+        edit).
+        """
+        results = self._layer.apply_edits(edits['adds'], edits['updates'], edits['deletes'],
+                                          batch_size=self._batch_size, max_workers=self._max_workers,
+                                          max_retries=self._max_retries, backoff=self._backoff)
+        summary = {}
+        errors = []
+        for operation in ('adds', 'updates', 'deletes'):
+            operation_results = results[operation[:-1] + 'Results']
+            summary[operation] = sum(1 for result in operation_results if result['success'])
+            errors.extend(result['error'] for result in operation_results if not result['success'])
+        summary.update(unchanged=edits.get('unchanged', 0), incomplete=edits.get('incomplete', False),
+                       failedChunks=results['failedChunks'], errors=errors)
+        return summary
+
+    def sync(self, features, dry_run=False):
+        """diff() and apply() in one call; with dry_run only the counts of the edits that would be sent."""
+        edits = self.diff(features)
+        if dry_run:
+            return {'adds': len(edits['adds']), 'updates': len(edits['updates']),
+                    'deletes': len(edits['deletes']), 'unchanged': edits['unchanged'],
+                    'incomplete': edits['incomplete']}
+        return self.apply(edits)
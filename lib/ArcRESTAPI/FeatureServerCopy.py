@@ -0,0 +1,216 @@
+"""
+COPYRIGHT 2016 ESRI
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>
+"""
+__author__='joelwhitney'
+"""
+  Requires Python 3+
+  A simple wrapper around the ArcREST API to make my life easier.... maybe.
+
+  The FeatureServerCopy.py class moves the features of every layer of a
+  source feature server into the layers with the same ids of a target
+  feature server (usually one created by AGOLHandler.copy_feature_server).
+  Source layers are read with paged queries in objectId order and written
+  with parallel chunked addFeatures, several layers at a time. Progress is
+  kept in a checkpoint file so an interrupted copy resumes after the last
+  committed objectId.
+"""
+import concurrent.futures
+import os
+import threading
+from ArcRESTAPI import FeatureServices
+from ArcRESTAPI.TokenManager import request_json
+from HTTPTransport import JSONBackend
+
+
+class FeatureServerCopy(object):
+    """
+    Copies the features of source_url's layers to target_url.
+
+    Per layer the checkpoint records the highest source objectId up to which every feature has been added
+    ('last_object_id'), the source objectIds added beyond it by chunks that finished after an earlier chunk
+    failed ('committed') and whether the layer is complete ('done'). A run started with the same
+    checkpoint_file skips everything recorded there.
+
+    A chunk that failed with a network error may still have been applied by the server. It is not recorded
+    as committed, so a resumed run sends it again; check the target for those features before resuming.
+    """
+    def __init__(self, source_url, target_url, agol_handler=None, session=None, checkpoint_file=None,
+                 where='1=1', max_layers=2, max_workers=4, page_size=None, chunk_size=None, max_retries=3,
+                 backoff=1.0):
+        self._source_url = source_url.rstrip('/')
+        self._target_url = target_url.rstrip('/')
+        self._agol_handler = agol_handler
+        self._session = session
+        self._checkpoint_file = checkpoint_file
+        self._where = where
+        self._max_layers = max_layers
+        self._max_workers = max_workers
+        self._page_size = page_size
+        self._chunk_size = chunk_size
+        self._max_retries = max_retries
+        self._backoff = backoff
+        self._lock = threading.Lock()
+        self._checkpoint = self.__load_checkpoint()
+        with self._lock:
+            # records the target right away, a resumed copy must not create another service
+            self.__save_checkpoint()
+
+    def __load_checkpoint(self):
+        checkpoint = {'source': self._source_url, 'target': self._target_url, 'layers': {}}
+        if self._checkpoint_file and os.path.exists(self._checkpoint_file):
+            with open(self._checkpoint_file) as infile:
+                checkpoint = JSONBackend.loads(infile.read())
+            if checkpoint.get('source') != self._source_url or checkpoint.get('target') != self._target_url:
+                raise ValueError('Checkpoint {} belongs to a copy of {} to {}'.format(
+                    self._checkpoint_file, checkpoint.get('source'), checkpoint.get('target')))
+        return checkpoint
+
+    def __save_checkpoint(self):
+        # callers hold _lock; written to a temporary file first so a crash never leaves half a checkpoint
+        if not self._checkpoint_file:
+            return
+        temp_file = self._checkpoint_file + '.tmp'
+        with open(temp_file, 'w') as outfile:
+            JSONBackend.dump(self._checkpoint, outfile)
+        os.replace(temp_file, self._checkpoint_file)
+
+    def __layer_state(self, layer_id):
+        with self._lock:
+            return self._checkpoint['layers'].setdefault(str(layer_id), {'last_object_id': None,
+                                                                          'committed': [],
+                                                                          'added': 0,
+                                                                          'failed': 0,
+                                                                          'done': False})
+
+    def run(self, layer_ids=None):
+        """
+        Copies the layers (all layers and tables of the source by default) and returns a dict keyed by layer
+        id with 'added', 'failed' (features the target rejected), 'done' and 'error' (None, or why the layer
+        stopped; run again to resume it).
+        """
+        source = FeatureServices.AGOLFeatureServer(self._source_url, '', agol_handler=self._agol_handler,
+                                                   session=self._session)
+        source_layers = source.layers + source.tables
+        if layer_ids is not None:
+            source_layers = [layer for layer in source_layers if layer.layer_id in layer_ids]
+        results = {}
+        if not source_layers:
+            return results
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, min(self._max_layers,
+                                                                          len(source_layers)))) as executor:
+            futures = dict((executor.submit(self.__copy_layer, layer), layer.layer_id) for layer in source_layers)
+            for future in concurrent.futures.as_completed(futures):
+                layer_id = futures[future]
+                state = self.__layer_state(layer_id)
+                try:
+                    future.result()
+                    error = None
+                except (FeatureServices.AGOLRequestError, ValueError, OSError) as e:
+                    error = str(e)
+                    print('Copying layer {} stopped: {}'.format(layer_id, error))
+                results[layer_id] = {'added': state['added'], 'failed': state['failed'], 'done': state['done'],
+                                     'error': error}
+        return results
+
+    def __copy_layer(self, source_layer):
+        state = self.__layer_state(source_layer.layer_id)
+        if state['done']:
+            return
+        target_layer = FeatureServices.AGOLFeatureServerLayer(
+            self._target_url + '/{}'.format(source_layer.layer_id), self._agol_handler, session=self._session,
+            lazy=True)
+        object_id_field = source_layer.object_id_field
+        chunk_size = self._chunk_size or source_layer.max_record_count
+        where = self._where
+        if state['last_object_id'] is not None:
+            where = '({}) AND {} > {}'.format(where, object_id_field, state['last_object_id'])
+        # enough features for max_workers addFeatures requests at a time
+        batch_size = chunk_size * max(1, self._max_workers)
+        batch = []
+        for feature in source_layer.query_iter(where=where, page_size=self._page_size):
+            batch.append(feature)
+            if len(batch) == batch_size:
+                self.__copy_batch(state, target_layer, batch, object_id_field, chunk_size)
+                batch = []
+        if batch:
+            self.__copy_batch(state, target_layer, batch, object_id_field, chunk_size)
+        with self._lock:
+            state['done'] = True
+            self.__save_checkpoint()
+
+    def __copy_batch(self, state, target_layer, batch, object_id_field, chunk_size):
+        with self._lock:
+            committed = set(state['committed'])
+        pending = []
+        for feature in batch:
+            object_id = feature['attributes'][object_id_field]
+            if object_id not in committed:
+                pending.append((object_id, feature))
+        if not pending:
+            return
+        pending.sort(key=lambda item: item[0])
+        chunks = FeatureServices._chunks(pending, chunk_size)
+        token_manager = FeatureServices._token_manager(self._agol_handler)
+        request = target_layer.url + '/addFeatures?'
+
+        def submit(chunk):
+            features = []
+            for object_id, feature in chunk:
+                # the target assigns its own objectIds
+                attributes = dict((key, value) for key, value in feature['attributes'].items()
+                                  if key != object_id_field)
+                features.append(dict(feature, attributes=attributes))
+            parameters = {'features': JSONBackend.dumps(features),
+                          'f': 'json'}
+            return request_json(target_layer.session, request, parameters, token_manager)
+
+        responses = FeatureServices._run_chunks(submit, chunks, self._max_workers, self._max_retries, self._backoff)
+        first_error = None
+        with self._lock:
+            for chunk, (json_response, error) in zip(chunks, responses):
+                object_ids = [object_id for object_id, feature in chunk]
+                if error is not None:
+                    first_error = first_error or error
+                    continue
+                add_results = json_response.get('addResults', [])
+                state['added'] += sum(1 for result in add_results if result.get('success'))
+                state['failed'] += sum(1 for result in add_results if not result.get('success'))
+                if first_error is None:
+                    last_object_id = state['last_object_id']
+                    state['last_object_id'] = max(object_ids) if last_object_id is None else max(last_object_id,
+                                                                                                    max(object_ids))
+                else:
+                    state['committed'].extend(object_ids)
+            if state['last_object_id'] is not None:
+                state['committed'] = [object_id for object_id in state['committed']
+                                      if object_id > state['last_object_id']]
+            self.__save_checkpoint()
+        if first_error is not None:
+            raise FeatureServices.AGOLRequestError({'code': first_error['code'],
+                                                    'message': 'addFeatures failed after {} retries: {}'.format(
+                                                        self._max_retries, first_error['description'])})
+
+    @property
+    def checkpoint(self):
+        return self._checkpoint
+
+    @property
+    def source_url(self):
+        return self._source_url
+
+    @property
+    def target_url(self):
+        return self._target_url
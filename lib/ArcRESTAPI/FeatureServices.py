@@ -23,56 +23,143 @@ __author__='joelwhitney'
   modifying feature servers/services and retrieving information.
 """
 import urllib
+import urllib.error
 import urllib.parse
 import urllib.request
 import json
+import socket
+import time
+import threading
+import concurrent.futures
 from ArcRESTAPI.AGOLHandler import *
+from HTTPTransport import JSONBackend
+from HTTPTransport.HTTPSession import default_session
+from ArcRESTAPI.TokenManager import request_json
 
-def stringify(response_string):
-    response_conversion = ''
-    for word in response_string.split():
-        new_word = word
-        if word == 'true':
-            new_word = '\"true\"'
-        if word == 'false':
-            new_word = '\"false\"'
-        if word == 'none':
-            new_word = '\"none\"'
-        if word == 'true,':
-            new_word = '\"true\",'
-        if word == 'false,':
-            new_word = '\"false\",'
-        if word == 'none,':
-            new_word = '\"none\",'
-        if word == 'null,':
-            new_word = '\"none\",'
-        response_conversion += (new_word + ' ')
-    return response_conversion
+_LITERAL_STRINGS = {True: 'true', False: 'false', None: 'none'}
+
+def stringify_literals(obj):
+    """
+    Replaces the JSON literals true/false/null in a decoded response with the strings 'true'/'false'/'none'
+    that the copy workflow sends back to createService/updateDefinition. One pass over the decoded object,
+    string values (e.g. a field alias containing 'true') are left alone.
+    """
+    if isinstance(obj, dict):
+        return dict((key, stringify_literals(value)) for key, value in obj.items())
+    if isinstance(obj, list):
+        return [stringify_literals(value) for value in obj]
+    if obj is None or isinstance(obj, bool):
+        return _LITERAL_STRINGS[obj]
+    return obj
+
+class AGOLRequestError(ValueError):
+    """error object returned by an ArcGIS REST endpoint"""
+    def __init__(self, error):
+        self.code = error.get('code')
+        self.details = error.get('details', [])
+        super(AGOLRequestError, self).__init__('{}: {}'.format(self.code, error.get('message')))
+
+def _resolve_session(agol_handler, session):
+    """explicit session first, then the handler's session, then the shared default"""
+    if session is not None:
+        return session
+    if agol_handler is not None:
+        return agol_handler.session
+    return default_session()
+
+def _resolve_count_ttl(agol_handler, count_ttl):
+    """explicit count_ttl first, then the handler's, otherwise no count caching"""
+    if count_ttl is not None:
+        return count_ttl
+    return getattr(agol_handler, 'count_ttl', None) or 0
+
+def _token_manager(agol_handler):
+    """the handler's TokenManager, requests made without a handler are anonymous"""
+    return agol_handler.token_manager if agol_handler is not None else None
+
+def _chunks(items, chunk_size):
+    """splits a list into consecutive chunks of at most chunk_size items"""
+    return [items[i:i + chunk_size] for i in range(0, len(items), chunk_size)]
+
+def _request_not_sent(e):
+    """True for errors raised before the request reached the server, or when the server refused it outright"""
+    if isinstance(e, urllib.error.HTTPError):
+        return e.code in (429, 503)
+    if isinstance(e, urllib.error.URLError):
+        e = e.reason
+    return isinstance(e, (ConnectionRefusedError, socket.gaierror))
+
+def _run_chunks(submit, chunks, max_workers=4, max_retries=3, backoff=1.0, on_done=None, idempotent=False):
+    """
+    Calls submit(chunk) for every chunk on a thread pool, retrying a chunk whose response carries an 'error'
+    up to max_retries times (waiting backoff, 2*backoff, ... seconds). A request that raised is only retried
+    when it never reached the server (connection refused, DNS failure, HTTP 429/503) unless idempotent is
+    set: a timeout or dropped connection may come after the server applied the edits, and sending adds again
+    would duplicate them. Returns a list with one (json_response, error) tuple per chunk, in chunk order;
+    error is None for chunks that succeeded. on_done(chunk, json_response, error) is called as each chunk
+    finishes.
+    """
+    def run(chunk):
+        error = None
+        for attempt in range(max_retries + 1):
+            if attempt:
+                time.sleep(backoff * 2 ** (attempt - 1))
+            try:
+                json_response = submit(chunk)
+            except (urllib.error.URLError, OSError, ValueError) as e:
+                error = {'code': None, 'description': str(e)}
+                if idempotent or _request_not_sent(e):
+                    continue
+                break
+            if 'error' not in json_response:
+                error = None
+                break
+            error = {'code': json_response['error'].get('code'),
+                     'description': json_response['error'].get('message')}
+        if error is not None:
+            json_response = None
+        if on_done is not None:
+            on_done(chunk, json_response, error)
+        return json_response, error
+    if not chunks:
+        return []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(chunks)))) as executor:
+        return list(executor.map(run, chunks))
 
 class AGOLFeatureServer(object):
     """
     Wrapper around AGOL Feature Server.
+
+    Only the service definition is requested at construction. The layers and tables are discovered on first
+    access: all layer definitions come from the service's /layers endpoint in one request, or, where that is
+    not available, from the individual layer urls fetched max_workers at a time. With lazy_layers the layer
+    objects are created without any request and each fetches its own definition when first used. count_ttl
+    is passed on to the layers (by default the agol_handler's count_ttl).
     """
-    def __init__(self, feature_server_url, feature_server_name, agol_handler=None):
+    def __init__(self, feature_server_url, feature_server_name, agol_handler=None, session=None,
+                 lazy_layers=False, max_workers=8, count_ttl=None):
         self._feature_server_url = feature_server_url
         self._feature_server_name = feature_server_name
         self._agol_handler = agol_handler
+        self._session = _resolve_session(agol_handler, session)
+        self._count_ttl = _resolve_count_ttl(agol_handler, count_ttl)
+        self._lazy_layers = lazy_layers
+        self._max_workers = max_workers
         self._service_definition = self.__service_definition()
         self._create_parameters_template = self.__create_parameters_template()
         self._item_id = ''
-        self._layers = self.__get_layers()
+        self._layers = None
+        self._tables = None
+        self._layers_lock = threading.Lock()
 
-    def write_jsonfile(self, returned_json, filename='\json_file'):
+    def write_jsonfile(self, returned_json, filename='\json_file', compact=False):
         with open(filename + '.json', 'w') as outfile:
-            json.dump(returned_json, outfile, sort_keys=False, indent=4, ensure_ascii=False)
+            JSONBackend.dump(returned_json, outfile, indent=None if compact else 4)
 
     def __service_definition(self):
-        parameters = {'f': 'pjson'}
-        if self._agol_handler is not None: parameters['token'] = self._agol_handler.token
-        parameters = urllib.parse.urlencode(parameters).encode("utf-8")
         request_url = self._feature_server_url
-        response = urllib.request.urlopen(request_url, parameters).read().decode("utf-8")
-        jsonResponse = json.loads(stringify(response))
+        jsonResponse = stringify_literals(request_json(self.session, request_url, {'f': 'pjson'},
+                                                       _token_manager(self._agol_handler)))
         jsonResponse['name'] = self._feature_server_name
         return jsonResponse
 
@@ -88,14 +175,56 @@ class AGOLFeatureServer(object):
         return createParameterTemplate
 
     def __get_layers(self):
-        layers = []
-        for layer in self.service_definition['layers']:
-            fs_layer_url = self._feature_server_url + '/{}'.format(layer['id'])
-            layers.append(AGOLFeatureServerLayer(fs_layer_url, self._agol_handler))
-        return layers
+        """Returns (layers, tables) as lists of AGOLFeatureServerLayer in service definition order."""
+        summaries = {'layers': self.service_definition.get('layers') or [],
+                     'tables': self.service_definition.get('tables') or []}
+        if self._lazy_layers:
+            definitions = {}
+        else:
+            definitions = self.__layer_definitions() or self.__fetch_layer_definitions(summaries)
+        results = []
+        for kind in ('layers', 'tables'):
+            results.append([AGOLFeatureServerLayer(self._feature_server_url + '/{}'.format(summary['id']),
+                                                   self._agol_handler, session=self._session,
+                                                   service_definition=definitions.get(summary['id']),
+                                                   lazy=self._lazy_layers, count_ttl=self._count_ttl)
+                            for summary in summaries[kind]])
+        return tuple(results)
+
+    def __layer_definitions(self):
+        """All layer and table definitions keyed by id from the /layers endpoint, None if it is not supported."""
+        request_url = self._feature_server_url + '/layers'
+        try:
+            json_response = request_json(self.session, request_url, {'f': 'json'}, _token_manager(self._agol_handler))
+        except (urllib.error.URLError, OSError, ValueError):
+            # e.g. a 404 from servers without the endpoint, the layers are then fetched one by one
+            return None
+        if not isinstance(json_response, dict) or 'error' in json_response or 'layers' not in json_response:
+            return None
+        json_response = stringify_literals(json_response)
+        return {definition['id']: definition
+                for definition in (json_response.get('layers') or []) + (json_response.get('tables') or [])}
+
+    def __fetch_layer_definitions(self, summaries):
+        ids = [summary['id'] for kind in ('layers', 'tables') for summary in summaries[kind]]
+        if not ids:
+            return {}
+        token_manager = _token_manager(self._agol_handler)
+
+        def fetch(layer_id):
+            return stringify_literals(request_json(self.session, self._feature_server_url + '/{}'.format(layer_id),
+                                                   {'f': 'json'}, token_manager))
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, min(self._max_workers, len(ids)))) as executor:
+            return dict(zip(ids, executor.map(fetch, ids)))
 
-    def add_layers(self, copied_fs_layers):
-        # add service definition for each layer in one rest call
+    def __load_layers(self):
+        with self._layers_lock:
+            if self._layers is None:
+                self._layers, self._tables = self.__get_layers()
+
+    def add_layers(self, copied_fs_layers, copied_fs_tables=None):
+        # add service definition for each layer (and table) in one rest call
         url = 'https://services.arcgis.com/{}/ArcGIS/rest/admin/services/{}/FeatureServer/updateDefinition?'.format(self._agol_handler.portal.id, self.name)
         print(url)
         layers = []
@@ -103,10 +232,10 @@ class AGOLFeatureServer(object):
             layers.append(layer.service_definition)
             print(layer.service_definition)
         parameters = {'layers': layers, 'f': 'pjson'}
+        if copied_fs_tables:
+            parameters['tables'] = [table.service_definition for table in copied_fs_tables]
         print(parameters)
-        if self._agol_handler is not None: parameters['token'] = self._agol_handler.token
-        parameters = urllib.parse.urlencode(parameters).encode("utf-8")
-        jsonResponse = json.loads(urllib.request.urlopen(url, parameters).read().decode("utf-8"))
+        jsonResponse = request_json(self.session, url, parameters, _token_manager(self._agol_handler))
         print(jsonResponse)
         return self
 
@@ -132,38 +261,56 @@ class AGOLFeatureServer(object):
 
     @property
     def layers(self):
+        self.__load_layers()
         return self._layers
 
+    @property
+    def tables(self):
+        self.__load_layers()
+        return self._tables
+
+    @property
+    def session(self):
+        return self._session
+
 
 class AGOLFeatureServerLayer(object):
     """
     Wrapper around the Feature Server layers.
+
+    service_definition can be passed when it is already known (AGOLFeatureServer reads all of them in one
+    request); otherwise it is requested at construction, or on first use if lazy is set.
+
+    count_ttl keeps the results of count() for that many seconds (default: the agol_handler's count_ttl, and
+    without one 0, no caching); edits made through this object clear them.
     """
-    def __init__(self, feature_server_layer_url, agol_handler=None):
+    def __init__(self, feature_server_layer_url, agol_handler=None, session=None, service_definition=None,
+                 lazy=False, count_ttl=None):
         self._agol_handler = agol_handler
+        self._count_ttl = _resolve_count_ttl(agol_handler, count_ttl)
+        self._counts = {}
+        self._counts_lock = threading.Lock()
+        self._session = _resolve_session(agol_handler, session)
         self._feature_server_layer_url = feature_server_layer_url
         #self._layer_parameters_template = self.__layer_parameters_template()
-        self._service_definition = self.__service_definition()
-        self._name = self._service_definition['name']
-        self._layer_id = self._service_definition['id']
-        self._type = self._service_definition['type']
+        self._service_definition = service_definition
+        if self._service_definition is None and not lazy:
+            self._service_definition = self.__service_definition()
 
-    def write_jsonfile(self, returned_json, filename='\json_file'):
+    def write_jsonfile(self, returned_json, filename='\json_file', compact=False):
         print(returned_json)
         with open(filename + '.json', 'w') as outfile:
-            json.dump(returned_json, outfile, sort_keys=False, indent=4, ensure_ascii=False)
+            JSONBackend.dump(returned_json, outfile, indent=None if compact else 4)
 
     def add_features(self, agol_json):
         parameters = {'features': agol_json,
                       'f': 'json'}
-        if self._agol_handler: parameters['token'] = self._agol_handler.token
-        parameters = urllib.parse.urlencode(parameters).encode("utf-8")
-        print(str(self._layer_id))
-        request = self._feature_server_layer_url + '/{}/addFeatures?'.format(self.layer_id)
+        request = self._feature_server_layer_url + '/addFeatures?'
         print(request)
+        self.clear_count_cache()
         try:
-            json_response = json.loads(urllib.request.urlopen(request, parameters).read().decode("utf-8"))
-            if 'deleteResults' in json_response:
+            json_response = request_json(self.session, request, parameters, _token_manager(self._agol_handler))
+            if 'addResults' in json_response:
                 return json_response
             elif 'error' in json_response:
                 print(json_response['error']['code'])
@@ -174,15 +321,125 @@ class AGOLFeatureServerLayer(object):
             print('An unspecified error occurred.')
             print(e)
 
-    def delete_features(self, where='ObjectId>0'):
+    def add_features_bulk(self, features, chunk_size=None, max_workers=4, max_retries=3, backoff=1.0):
+        """
+        Uploads any number of features with addFeatures, chunk_size features per request (default: the
+        layer's maxRecordCount), up to max_workers chunks in flight at once. A chunk the server rejects, or
+        that could not be sent, is retried up to max_retries times with exponential backoff; a chunk whose
+        request failed after it was sent is not, as the server may already have added it.
+
+        features is a list of ArcREST feature dicts ({'geometry': .., 'attributes': ..}, e.g.
+        AGOL_JSON.raw_arcrest_json) or the same list as a JSON string. Returns a dict with 'addResults',
+        one result per feature in input order; features of a chunk that still failed after the retries
+        get {'objectId': None, 'success': False, 'error': {...}}. 'failedChunks' counts those chunks.
+        """
+        if isinstance(features, str):
+            features = JSONBackend.loads(features)
+        chunk_size = chunk_size or self.max_record_count
+        request = self._feature_server_layer_url + '/addFeatures?'
+
+        def submit(chunk):
+            parameters = {'features': JSONBackend.dumps(chunk),
+                          'f': 'json'}
+            return request_json(self.session, request, parameters, _token_manager(self._agol_handler))
+
+        chunks = _chunks(list(features), chunk_size)
+        self.clear_count_cache()
+        add_results = []
+        failed_chunks = 0
+        for chunk, (json_response, error) in zip(chunks, _run_chunks(submit, chunks, max_workers,
+                                                                      max_retries, backoff)):
+            if error is None:
+                add_results.extend(json_response.get('addResults', []))
+            else:
+                failed_chunks += 1
+                print('addFeatures chunk of {} features failed: {}'.format(len(chunk), error['description']))
+                add_results.extend({'objectId': None, 'success': False, 'error': error} for _ in chunk)
+        return {'addResults': add_results, 'failedChunks': failed_chunks}
+
+    def apply_edits(self, adds=None, updates=None, deletes=None, batch_size=None, rollback_on_failure=None,
+                    use_global_ids=False, max_workers=4, max_retries=3, backoff=1.0):
+        """
+        Sends adds, updates (ArcREST feature dicts) and deletes (objectIds, or globalIds with use_global_ids)
+        through applyEdits. The edits are mixed into batches of batch_size edits (default: the layer's
+        maxRecordCount), up to max_workers batches in flight at once, a failed batch retried up to max_retries
+        times with exponential backoff. While there are adds, a batch whose request failed after it was sent
+        is not retried (see _run_chunks). rollback_on_failure (None leaves the server default) makes each
+        batch all or nothing.
+
+        Returns a dict with 'addResults', 'updateResults' and 'deleteResults', one compact result per edit in
+        input order: {'objectId': .., 'success': True} (plus 'globalId' when the server returns one), with an
+        'error' for edits that failed, including every edit of a batch that still failed after the retries.
+        'failedChunks' counts those batches.
+        """
+        operations = ([('adds', feature) for feature in adds or []] +
+                      [('updates', feature) for feature in updates or []] +
+                      [('deletes', object_id) for object_id in deletes or []])
+        chunks = _chunks(operations, batch_size or self.max_record_count)
+        request = self._feature_server_layer_url + '/applyEdits?'
+        self.clear_count_cache()
+
+        def submit(chunk):
+            parameters = {'f': 'json'}
+            for operation in ('adds', 'updates'):
+                batch = [feature for kind, feature in chunk if kind == operation]
+                if batch:
+                    parameters[operation] = JSONBackend.dumps(batch)
+            batch = [object_id for kind, object_id in chunk if kind == 'deletes']
+            if batch:
+                # globalIds go as a JSON array, objectIds as a comma separated list
+                parameters['deletes'] = JSONBackend.dumps(batch) if use_global_ids else ','.join(str(object_id) for object_id in batch)
+            if rollback_on_failure is not None:
+                parameters['rollbackOnFailure'] = 'true' if rollback_on_failure else 'false'
+            if use_global_ids:
+                parameters['useGlobalIds'] = 'true'
+            return request_json(self.session, request, parameters, _token_manager(self._agol_handler))
+
+        results = {'addResults': [], 'updateResults': [], 'deleteResults': [], 'failedChunks': 0}
+        for chunk, (json_response, error) in zip(chunks, _run_chunks(submit, chunks, max_workers, max_retries,
+                                                                      backoff, idempotent=not adds)):
+            if error is not None:
+                results['failedChunks'] += 1
+                print('applyEdits batch of {} edits failed: {}'.format(len(chunk), error['description']))
+            for operation in ('adds', 'updates', 'deletes'):
+                key = operation[:-1] + 'Results'
+                edits = [edit for kind, edit in chunk if kind == operation]
+                if error is not None:
+                    results[key].extend({'objectId': None, 'success': False, 'error': error} for _ in edits)
+                    continue
+                edit_results = json_response.get(key) or []
+                for edit_result in edit_results:
+                    compact_result = {'objectId': edit_result.get('objectId'), 'success': bool(edit_result.get('success'))}
+                    if edit_result.get('globalId'):
+                        compact_result['globalId'] = edit_result['globalId']
+                    if not compact_result['success']:
+                        compact_result['error'] = edit_result.get('error')
+                    results[key].append(compact_result)
+                # a response missing results for some edits counts those edits as failed
+                results[key].extend({'objectId': None, 'success': False,
+                                     'error': {'code': None, 'description': 'no result returned'}}
+                                    for _ in edits[len(edit_results):])
+        return results
+
+    def delete_features(self, where='ObjectId>0', chunked=False, batch_size=None, max_workers=4, max_retries=3,
+                        backoff=1.0, progress=None):
+        """
+        Deletes the features matching where. By default that is one deleteFeatures request, which the server
+        runs as a single delete. With chunked the matching objectIds are read with returnIdsOnly and deleted
+        batch_size ids per request (default: maxRecordCount), max_workers requests at a time, so no single
+        request has to delete a large layer. progress(deleted, total) is called after every batch, by default
+        the progress is printed. The chunked mode returns a dict with 'deleteResults' and 'failedChunks'; ids the
+        server refuses to delete (success false) are reported there once and not sent again.
+        """
+        self.clear_count_cache()
+        if chunked:
+            return self.__delete_in_batches(where, batch_size or self.max_record_count, max_workers, max_retries,
+                                            backoff, progress)
         parameters = {'where': where,
                       'f': 'pjson'}
-        if self._agol_handler: parameters['token'] = self._agol_handler.token
-        parameters = urllib.parse.urlencode(parameters).encode("utf-8")
-        request = self._feature_server_layer_url + '/{}/deleteFeatures?'.format(self.layer_id)
-        request = self._feature_server_layer_url + '/{}/deleteFeatures?'.format(self.layer_id)
+        request = self._feature_server_layer_url + '/deleteFeatures?'
         try:
-            json_response = json.loads(urllib.request.urlopen(request, parameters).read().decode("utf-8"))
+            json_response = request_json(self.session, request, parameters, _token_manager(self._agol_handler))
             if 'deleteResults' in json_response:
                 return json_response
             elif 'error' in json_response:
@@ -194,11 +451,90 @@ class AGOLFeatureServerLayer(object):
             print('An unspecified error occurred.')
             print(e)
 
+    def __delete_in_batches(self, where, batch_size, max_workers, max_retries, backoff, progress):
+        request = self._feature_server_layer_url + '/deleteFeatures?'
+        lock = threading.Lock()
+        results = {'deleteResults': [], 'failedChunks': 0}
+        deleted = [0]
+
+        def submit(chunk):
+            parameters = {'objectIds': ','.join(str(object_id) for object_id in chunk),
+                          'f': 'json'}
+            return request_json(self.session, request, parameters, _token_manager(self._agol_handler))
+
+        failed_ids = set()
+        round_where = where
+        while True:
+            # servers may cap returnIdsOnly, so ids are read again until a round comes back complete;
+            # ids the server refused to delete are not sent again
+            ids_response = self.__query({'where': round_where, 'returnIdsOnly': 'true'})
+            object_ids = sorted(object_id for object_id in ids_response.get('objectIds') or []
+                                if object_id not in failed_ids)
+            if not object_ids:
+                return results
+            total = deleted[0] + len(object_ids)
+            deleted_before = deleted[0]
+
+            def on_done(chunk, json_response, error):
+                with lock:
+                    if error is None:
+                        deleted[0] += sum(1 for result in json_response.get('deleteResults', [])
+                                          if result.get('success'))
+                    if progress is not None:
+                        progress(deleted[0], total)
+                    else:
+                        print('Deleted {} of {} features'.format(deleted[0], total))
+
+            chunks = _chunks(object_ids, batch_size)
+            failed_chunks = 0
+            # deleting the same objectIds twice is harmless, so every failure is retried
+            for chunk, (json_response, error) in zip(chunks, _run_chunks(submit, chunks, max_workers, max_retries,
+                                                                          backoff, on_done, idempotent=True)):
+                if error is None:
+                    delete_results = json_response.get('deleteResults', [])
+                    results['deleteResults'].extend(delete_results)
+                    failed_ids.update(result.get('objectId') for result in delete_results if not result.get('success'))
+                else:
+                    failed_chunks += 1
+                    print('deleteFeatures batch of {} ids failed: {}'.format(len(chunk), error['description']))
+                    results['deleteResults'].extend({'objectId': object_id, 'success': False, 'error': error}
+                                                    for object_id in chunk)
+            results['failedChunks'] += failed_chunks
+            if failed_chunks or not ids_response.get('exceededTransferLimit', False):
+                return results
+            if deleted[0] == deleted_before:
+                # a full page that could not be deleted, page past it instead of reading the same ids again
+                round_where = '({}) AND {} > {}'.format(where, self.object_id_field, object_ids[-1])
+
+    def truncate(self, attachment_only=False):
+        """
+        Deletes every feature at once with the admin truncate operation (hosted layers whose definition has
+        supportsTruncate). Returns the server response; raises AGOLRequestError if the server answers with
+        an error.
+        """
+        request = self._feature_server_layer_url.replace('/rest/services/', '/rest/admin/services/', 1) + '/truncate?'
+        parameters = {'attachmentOnly': 'true' if attachment_only else 'false',
+                      'async': 'false',
+                      'f': 'json'}
+        self.clear_count_cache()
+        json_response = request_json(self.session, request, parameters, _token_manager(self._agol_handler))
+        if 'error' in json_response:
+            raise AGOLRequestError(json_response['error'])
+        return json_response
+
+    def delete_all(self, **kwargs):
+        """
+        Empties the layer: truncate when the layer supports it, otherwise a chunked delete_features of every
+        feature (keyword arguments go to delete_features).
+        """
+        if self.supports_truncate:
+            return self.truncate()
+        return self.delete_features(where='1=1', chunked=True, **kwargs)
+
     def __service_definition(self):
-        parameters = urllib.parse.urlencode({'f': 'pjson'}).encode("utf-8")
         request_url = self._feature_server_layer_url
-        response = urllib.request.urlopen(request_url, parameters).read().decode("utf-8")
-        jsonResponse = json.loads(stringify(response))
+        jsonResponse = stringify_literals(request_json(self.session, request_url, {'f': 'pjson'},
+                                                       _token_manager(self._agol_handler)))
         return jsonResponse
     #
     # def __layer_parameters_template(self):
@@ -212,44 +548,190 @@ class AGOLFeatureServerLayer(object):
     #             layerParametersTemplate[paramater] = self._service_definition[paramater]
     #     return layerParametersTemplate
 
-    def __get_feature_count(self):
-        parameters = urllib.parse.urlencode({'where': '1=1',
-                                             'returnCountOnly': 'true',
-                                             'f': 'json'}).encode("utf-8")
-        jsonResponse = json.loads(urllib.request.urlopen(self._feature_server_layer_url + '/{}/query?'.format(self.layer_id),
-                                                         parameters).read().decode("utf-8"))
-        return jsonResponse['count']
+    def count(self, where='1=1', use_cache=True):
+        """
+        Number of features matching where, counted by the server (returnCountOnly). Within count_ttl seconds
+        the previous count for the same where is returned unless use_cache is False.
+        """
+        if use_cache and self._count_ttl > 0:
+            with self._counts_lock:
+                cached = self._counts.get(where)
+            if cached is not None and time.time() - cached[0] < self._count_ttl:
+                return cached[1]
+        count = self.__query({'where': where, 'returnCountOnly': 'true'})['count']
+        if self._count_ttl > 0:
+            with self._counts_lock:
+                self._counts[where] = (time.time(), count)
+        return count
+
+    def clear_count_cache(self):
+        with self._counts_lock:
+            self._counts.clear()
+
+    def statistics(self, out_statistics, group_by=None, where='1=1', order_by=None):
+        """
+        Computes summary statistics on the server (outStatistics) and returns one attributes dict per group.
+
+        keyword arguments:
+        out_statistics -- list of statistic definitions, either dicts as the REST API expects them
+                          ({'statisticType': 'avg', 'onStatisticField': 'rating',
+                          'outStatisticFieldName': 'avg_rating'}) or (statistic_type, field) tuples, optionally
+                          with the output name as third item (default '<type>_<field>').
+        group_by       -- field name or list of field names to group by (default None, one row).
+        where          -- filter applied before computing (default '1=1').
+        order_by       -- orderByFields for the groups, e.g. 'count_objectid DESC' (default None).
+
+        raises AGOLRequestError if the server rejects the request.
+        """
+        definitions = []
+        for statistic in out_statistics:
+            if not isinstance(statistic, dict):
+                statistic_type, field = statistic[0], statistic[1]
+                out_name = statistic[2] if len(statistic) > 2 else '{}_{}'.format(statistic_type, field)
+                statistic = {'statisticType': statistic_type,
+                             'onStatisticField': field,
+                             'outStatisticFieldName': out_name}
+            definitions.append(statistic)
+        parameters = {'where': where,
+                      'outStatistics': JSONBackend.dumps(definitions),
+                      'returnGeometry': 'false'}
+        if group_by:
+            parameters['groupByFieldsForStatistics'] = group_by if isinstance(group_by, str) else ','.join(group_by)
+        if order_by:
+            parameters['orderByFields'] = order_by
+        json_response = self.__query(parameters)
+        return [feature['attributes'] for feature in json_response.get('features', [])]
+
+    def distinct(self, fields, where='1=1'):
+        """
+        Distinct values of a field (a list of values) or of several fields (a list of attribute dicts),
+        computed by the server with returnDistinctValues. Paged with resultOffset when the layer supports
+        pagination and there are more values than maxRecordCount.
+        """
+        field_list = [fields] if isinstance(fields, str) else list(fields)
+        parameters = {'where': where,
+                      'outFields': ','.join(field_list),
+                      'returnDistinctValues': 'true',
+                      'returnGeometry': 'false',
+                      'orderByFields': ','.join(field_list)}
+        rows = []
+        while True:
+            page_parameters = dict(parameters)
+            if rows and self.supports_pagination:
+                page_parameters.update(resultOffset=len(rows), resultRecordCount=self.max_record_count)
+            json_response = self.__query(page_parameters)
+            features = json_response.get('features', [])
+            rows.extend(feature['attributes'] for feature in features)
+            if not (features and json_response.get('exceededTransferLimit', False) and self.supports_pagination):
+                break
+        if isinstance(fields, str):
+            return [row.get(fields) for row in rows]
+        return rows
+
+    def __query(self, parameters):
+        request_url = self._feature_server_layer_url + '/query?'
+        json_response = request_json(self.session, request_url, dict(parameters, f='json'),
+                                     _token_manager(self._agol_handler))
+        if 'error' in json_response:
+            raise AGOLRequestError(json_response['error'])
+        return json_response
+
+    def query_iter(self, where='1=1', fields='*', page_size=None, strategy='auto', return_geometry=True,
+                   out_sr=None):
+        """
+        Generator over every feature matching where, one feature at a time, so large layers can be
+        exported in constant memory. page_size defaults to, and is capped at, the layer's maxRecordCount.
+
+        strategy:
+          'offset'    -- page with resultOffset/resultRecordCount ordered by the objectId field
+          'objectids' -- fetch the matching ids with returnIdsOnly, then query them in batches
+          'auto'      -- 'offset' if the layer supports pagination, else 'objectids' (default)
+
+        Both strategies yield the features in objectId order as long as fields includes the objectId field.
+
+        out_sr is the wkid the geometries are returned in (default: the layer's spatial reference).
+
+        raises AGOLRequestError if the server answers a page with an error.
+        """
+        page_size = min(page_size or self.max_record_count, self.max_record_count)
+        if strategy == 'auto':
+            strategy = 'offset' if self.supports_pagination else 'objectids'
+        parameters = {'where': where,
+                      'outFields': fields,
+                      'returnGeometry': 'true' if return_geometry else 'false'}
+        if out_sr is not None:
+            parameters['outSR'] = out_sr
+        if strategy == 'offset':
+            pages = self.__offset_pages(parameters, page_size)
+        elif strategy == 'objectids':
+            pages = self.__objectid_pages(parameters, page_size)
+        else:
+            raise ValueError("strategy must be 'auto', 'offset' or 'objectids'")
+        for page in pages:
+            for feature in page:
+                yield feature
+
+    def __offset_pages(self, parameters, page_size):
+        offset = 0
+        while True:
+            json_response = self.__query(dict(parameters,
+                                              orderByFields=self.object_id_field + ' ASC',
+                                              resultOffset=offset,
+                                              resultRecordCount=page_size))
+            features = json_response.get('features', [])
+            if not features:
+                return
+            yield features
+            offset += len(features)
+            if len(features) < page_size and not json_response.get('exceededTransferLimit', False):
+                return
+
+    def __objectid_pages(self, parameters, page_size):
+        json_response = self.__query({'where': parameters['where'], 'returnIdsOnly': 'true'})
+        object_ids = sorted(json_response.get('objectIds') or [])
+        for i in range(0, len(object_ids), page_size):
+            batch = object_ids[i:i + page_size]
+            json_response = self.__query(dict(parameters, where='1=1',
+                                              objectIds=','.join(str(object_id) for object_id in batch)))
+            features = json_response.get('features', [])
+            # the server returns a batch in no particular order
+            object_id_field = self.object_id_field
+            if all(object_id_field in feature.get('attributes', {}) for feature in features):
+                features.sort(key=lambda feature: feature['attributes'][object_id_field])
+            yield features
 
     @property
     def query_features(self, where='1=1', fields='*'):
-        parameters = urllib.parse.urlencode({'where': where,
-                                             'objectIds': '',
-                                             'time': '',
-                                             'geometry': '',
-                                             'geometryType': 'esriGeometryEnvelope',
-                                             'inSR': '',
-                                             'spatialRel': 'esriSpatialRelIntersects',
-                                             'relationParam': '',
-                                             'outFields': fields,
-                                             'returnGeometry': 'true',
-                                             'maxAllowableOffset': '',
-                                             'geometryPrecision': '',
-                                             'outSR': '',
-                                             'gdbVersion': '',
-                                             'returnDistinctValues': 'false',
-                                             'returnIdsOnly': 'false',
-                                             'orderByFields': '',
-                                             'groupByFieldsForStatistics': '',
-                                             'outStatistics': '',
-                                             'returnZ': 'false',
-                                             'returnM': 'false',
-                                             'f': 'json'}).encode("utf-8")
-        request_url = self._feature_server_layer_url + '/{}/query?'.format(self._layer_id)
-        jsonResponse = json.loads(urllib.request.urlopen(request_url, parameters).read().decode("utf-8"))
+        parameters = {'where': where,
+                      'objectIds': '',
+                      'time': '',
+                      'geometry': '',
+                      'geometryType': 'esriGeometryEnvelope',
+                      'inSR': '',
+                      'spatialRel': 'esriSpatialRelIntersects',
+                      'relationParam': '',
+                      'outFields': fields,
+                      'returnGeometry': 'true',
+                      'maxAllowableOffset': '',
+                      'geometryPrecision': '',
+                      'outSR': '',
+                      'gdbVersion': '',
+                      'returnDistinctValues': 'false',
+                      'returnIdsOnly': 'false',
+                      'orderByFields': '',
+                      'groupByFieldsForStatistics': '',
+                      'outStatistics': '',
+                      'returnZ': 'false',
+                      'returnM': 'false',
+                      'f': 'json'}
+        request_url = self._feature_server_layer_url + '/query?'
+        jsonResponse = request_json(self.session, request_url, parameters, _token_manager(self._agol_handler))
         return jsonResponse
 
     @property
     def service_definition(self):
+        if self._service_definition is None:
+            self._service_definition = self.__service_definition()
         return self._service_definition
 
     @property
@@ -262,15 +744,59 @@ class AGOLFeatureServerLayer(object):
 
     @property
     def name(self):
-        return self._name
+        return self.service_definition['name']
     @property
     def layer_id(self):
-        return self._layer_id
+        if self._service_definition is None:
+            # the id is the last url segment, no need to request the definition for it
+            layer_id = self._feature_server_layer_url.rstrip('/').rsplit('/', 1)[-1]
+            if layer_id.isdigit():
+                return int(layer_id)
+        return self.service_definition['id']
 
     @property
     def type(self):
-        return self._type
+        return self.service_definition['type']
+
+    @property
+    def object_id_field(self):
+        service_definition = self.service_definition
+        if service_definition.get('objectIdField') not in (None, 'none', ''):
+            return service_definition['objectIdField']
+        for field in service_definition.get('fields', []):
+            if field.get('type') == 'esriFieldTypeOID':
+                return field['name']
+        return 'OBJECTID'
+
+    @property
+    def supports_pagination(self):
+        service_definition = self.service_definition
+        advanced_query_capabilities = service_definition.get('advancedQueryCapabilities') or {}
+        if not isinstance(advanced_query_capabilities, dict):
+            advanced_query_capabilities = {}
+        supports_pagination = advanced_query_capabilities.get('supportsPagination',
+                                                              service_definition.get('supportsPagination'))
+        # the definition holds the literals as strings, see stringify_literals
+        return supports_pagination in (True, 'true')
+
+    @property
+    def supports_truncate(self):
+        return self.service_definition.get('supportsTruncate') in (True, 'true')
+
+    @property
+    def max_record_count(self):
+        """maximum number of records the layer accepts/returns per request"""
+        max_record_count = self.service_definition.get('maxRecordCount')
+        return max_record_count if isinstance(max_record_count, int) and max_record_count > 0 else 1000
 
     @property
     def feature_count(self):
-        return self.__get_feature_count()
+        return self.count()
+
+    @property
+    def session(self):
+        return self._session
+
+    @property
+    def agol_handler(self):
+        return self._agol_handler
@@ -0,0 +1,186 @@
+"""
+COPYRIGHT 2016 ESRI
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>
+"""
+__author__='joelwhitney'
+"""
+  Requires Python 3+
+  A simple wrapper around the ArcREST API to make my life easier.... maybe.
+
+  The TokenManager.py helper class keeps an AGOL/Portal token valid: it tracks
+  the expiry returned by generateToken, renews the token ahead of it on a
+  background timer and lets requests that failed with an expired token retry
+  once with a fresh one. request_json is the token aware POST used by
+  AGOLHandler and the FeatureServices classes.
+"""
+import threading
+import time
+import urllib
+import urllib.parse
+from HTTPTransport import JSONBackend
+
+# 498: invalid/expired token, 499: token required
+TOKEN_ERROR_CODES = (498, 499)
+
+
+class TokenError(ValueError):
+    """generateToken did not return a token"""
+
+
+def is_token_error(json_response):
+    error = json_response.get('error') if isinstance(json_response, dict) else None
+    return bool(error) and error.get('code') in TOKEN_ERROR_CODES
+
+def request_json(session, request_url, parameters, token_manager=None):
+    """
+    POSTs the parameters dict (plus the current token, if a token_manager is given) and returns the decoded
+    JSON response. A response rejecting the token makes the manager refresh it and the request is sent once
+    more with the new token.
+    """
+    for attempt in range(2):
+        request_parameters = dict(parameters)
+        token = None
+        if token_manager is not None:
+            token = token_manager.token
+            if token: request_parameters['token'] = token
+        data = urllib.parse.urlencode(request_parameters).encode("utf-8")
+        json_response = JSONBackend.loads(session.urlopen(request_url, data).read())
+        if token_manager is None or attempt or not is_token_error(json_response):
+            return json_response
+        token_manager.invalidate(token)
+    return json_response
+
+
+class TokenManager(object):
+    """
+    Thread-safe holder of an expiring token.
+
+    fetch_token is a callable returning (token, expires) with expires in epoch milliseconds, as returned by
+    generateToken, or None on failure. The token is renewed refresh_margin seconds before it expires, by a
+    background timer when auto_refresh is set and otherwise on the first access after that point. The timer
+    never fires sooner than retry_interval seconds, also for tokens that (by the local clock) are already
+    inside the margin or expired, and a failed renewal is retried after retry_interval.
+    """
+
+    def __init__(self, fetch_token=None, refresh_margin=300, auto_refresh=True, retry_interval=30):
+        self._fetch_token = fetch_token
+        self._refresh_margin = refresh_margin
+        self._auto_refresh = auto_refresh and fetch_token is not None
+        self._retry_interval = retry_interval
+        self._token = None
+        self._expires = None
+        self._lock = threading.RLock()
+        self._refresh_lock = threading.Lock()
+        self._timer = None
+        self._closed = False
+        self._refresh_count = 0
+
+    def refresh(self, raise_on_failure=False):
+        """
+        Fetches a new token now; returns it (None if generateToken failed). With raise_on_failure a failure
+        raises TokenError instead of scheduling a retry.
+        """
+        with self._refresh_lock:
+            return self.__refresh(raise_on_failure)
+
+    def __refresh(self, raise_on_failure=False):
+        # callers hold _refresh_lock; readers keep using the old token meanwhile
+        result = self._fetch_token() if self._fetch_token is not None else None
+        if result:
+            self.set(*result)
+        elif raise_on_failure:
+            raise TokenError('generateToken did not return a token')
+        else:
+            with self._lock:
+                self.__schedule(self._retry_interval)
+        return self._token
+
+    def set(self, token, expires):
+        """Stores a token obtained elsewhere (expires in epoch milliseconds)."""
+        with self._lock:
+            self._token = token
+            self._expires = expires / 1000.0 if expires else None
+            self._refresh_count += 1
+            if self._expires is not None:
+                # short-lived tokens are renewed half way through instead of immediately
+                lifetime = self._expires - time.time()
+                self.__schedule(max(0, lifetime - min(self._refresh_margin, lifetime / 2.0)))
+
+    def invalidate(self, token=None):
+        """
+        Called when the server rejected token. Only the first of several threads that failed with the same
+        token triggers a refresh; the others wait for it and pick up the new token.
+        """
+        with self._refresh_lock:
+            if token is None or token == self._token:
+                self.__refresh()
+
+    def needs_refresh(self, margin=None):
+        margin = self._refresh_margin if margin is None else margin
+        with self._lock:
+            return self._token is None or (self._expires is not None and
+                                           time.time() >= self._expires - margin)
+
+    def close(self):
+        """Stops the background refresh."""
+        with self._lock:
+            self._closed = True
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+    def __schedule(self, delay):
+        if not self._auto_refresh or self._closed:
+            return
+        if self._timer is not None:
+            self._timer.cancel()
+        # an expiry inside the margin (or clock skew) must not turn into a tight refresh loop
+        self._timer = threading.Timer(max(delay, self._retry_interval), self.__background_refresh)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def __background_refresh(self):
+        try:
+            self.refresh()
+        except Exception as e:
+            print('Token refresh failed: {}'.format(e))
+            with self._lock:
+                self.__schedule(self._retry_interval)
+
+    @property
+    def token(self):
+        """
+        The current token. A missing or expired token is renewed before returning; one that is merely inside
+        the refresh margin is renewed here only when there is no background timer doing it.
+        """
+        if self._fetch_token is not None and self.needs_refresh(0 if self._auto_refresh else None):
+            with self._refresh_lock:
+                if self.needs_refresh(0 if self._auto_refresh else None):
+                    self.__refresh()
+        return self._token
+
+    @property
+    def current_token(self):
+        """The token held right now, without renewing it."""
+        return self._token
+
+    @property
+    def expires(self):
+        """Expiry of the current token in epoch seconds."""
+        return self._expires
+
+    @property
+    def refresh_count(self):
+        return self._refresh_count
@@ -0,0 +1,424 @@
+"""
+Asyncio variant of the Google Places wrapper in GooglePlacesAPI.py.
+
+AsyncGooglePlaces exposes the same request methods as GooglePlaces, as
+coroutines sent through an HTTPTransport AsyncHTTPSession, so a single event
+loop can keep hundreds of Places requests in flight. The result objects are
+the regular GooglePlacesSearchResult/Place/Prediction classes.
+
+Requires Python 3.5+.
+"""
+from __future__ import absolute_import
+import asyncio
+import collections
+
+from . import lang
+from . import ranking
+from .GooglePlacesAPI import (GooglePlaces, GooglePlacesError,
+                              GooglePlacesSearchResult,
+                              GoogleAutocompleteSearchResult, Place,
+                              _encode_request, _endpoint_for,
+                              _is_over_query_limit, _parse_json_response,
+                              _parse_file_response, _place_details_params,
+                              _place_photo_params, _rate_limit_delay,
+                              _validate_response)
+from .cache import normalize_address
+from HTTPTransport import JSONBackend
+from HTTPTransport.AsyncHTTPSession import AsyncHTTPSession
+
+
+__all__ = ['AsyncGooglePlaces', 'geocode_location_async']
+
+
+async def _fetch_remote_async(service_url, params={}, use_http_post=False,
+                              session=None, rate_limiter=None):
+    if rate_limiter is not None:
+        delay = _rate_limit_delay(rate_limiter, _endpoint_for(service_url))
+        if delay > 0:
+            await asyncio.sleep(delay)
+    request_url, data = _encode_request(service_url, params, use_http_post)
+    return (request_url, await session.urlopen(request_url, data=data))
+
+async def _fetch_remote_json_async(service_url, params={}, use_http_post=False,
+                                   session=None, rate_limiter=None):
+    """Retrieves a JSON object from a URL, retrying OVER_QUERY_LIMIT responses
+    like _fetch_remote_json."""
+    retries = 0
+    while True:
+        request_url, response = await _fetch_remote_async(
+                service_url, params, use_http_post, session, rate_limiter)
+        json_response = _parse_json_response(response)
+        if rate_limiter is None or not _is_over_query_limit(
+                rate_limiter, _endpoint_for(service_url), json_response, retries):
+            return (request_url, json_response)
+        retries += 1
+
+async def _fetch_remote_file_async(service_url, params={}, use_http_post=False,
+                                   session=None, rate_limiter=None):
+    """Retrieves a file from a URL.
+
+    Returns a tuple (mimetype, filename, data)
+    """
+    request_url, response = await _fetch_remote_async(
+            service_url, params, use_http_post, session, rate_limiter)
+    return _parse_file_response(response)
+
+async def _poll_page_token_async(poller, fetch):
+    """Coroutine version of PageTokenPoller.poll; fetch is a coroutine function.
+
+    The delays are awaited, so other searches on the event loop keep making
+    progress while the token warms up.
+    """
+    url, response = await fetch()
+    for delay in poller.delays():
+        if response['status'] != 'INVALID_REQUEST':
+            break
+        await asyncio.sleep(delay)
+        url, response = await fetch()
+    return url, response
+
+async def geocode_location_async(location, sensor=False, session=None,
+                                 rate_limiter=None, cache=None):
+    """Coroutine version of geocode_location.
+
+    keyword arguments:
+    location -- A human-readable location, e.g 'London, England'
+    sensor   -- Boolean flag denoting if the location came from a device using
+                its' location sensor (default False)
+    session  -- The AsyncHTTPSession to send the request through.
+    rate_limiter -- An optional ratelimit.RateLimiter the request is booked
+                with (default None)
+    cache    -- An optional cache.GeocodeCache (default None)
+
+    raises:
+    GooglePlacesError -- if the geocoder fails to find a location.
+    """
+    if cache is not None:
+        cached_location = cache.get_location(location)
+        if cached_location is not None:
+            return cached_location
+    url, geo_response = await _fetch_remote_json_async(
+            GooglePlaces.GEOCODE_API_URL,
+            {'address': location, 'sensor': str(sensor).lower()},
+            session=session, rate_limiter=rate_limiter)
+    _validate_response(url, geo_response)
+    if geo_response['status'] == GooglePlaces.RESPONSE_STATUS_ZERO_RESULTS:
+        error_detail = ('Lat/Lng for location \'%s\' can\'t be determined.' %
+                        location)
+        raise GooglePlacesError(error_detail)
+    lat_lng = geo_response['results'][0]['geometry']['location']
+    if cache is not None:
+        cache.set_location(location, lat_lng)
+    return lat_lng
+
+async def _get_place_details_async(place_id, api_key, sensor=False,
+                                   language=lang.ENGLISH, session=None,
+                                   cache=None, rate_limiter=None):
+    """Gets a detailed place response.
+
+    keyword arguments:
+    place_id -- The unique identifier for the required place.
+    cache    -- An optional PlaceDetailsCache consulted before, and filled
+                after, the details request (default None).
+    """
+    if cache is not None:
+        cached_details = cache.get_details(place_id, language)
+        if cached_details is not None:
+            return cached_details
+    url, detail_response = await _fetch_remote_json_async(
+            GooglePlaces.DETAIL_API_URL,
+            _place_details_params(place_id, api_key, sensor, language),
+            session=session, rate_limiter=rate_limiter)
+    _validate_response(url, detail_response)
+    if cache is not None:
+        cache.set_details(place_id, language, detail_response['result'])
+    return detail_response['result']
+
+
+async def _gather_by_key(keys, fetch):
+    """Awaits fetch(key) for every key concurrently; returns a tuple (results,
+    errors) of dicts keyed by key, like _get_places_details."""
+    outcomes = await asyncio.gather(*[fetch(key) for key in keys],
+                                    return_exceptions=True)
+    results = {}
+    errors = {}
+    for key, outcome in zip(keys, outcomes):
+        if isinstance(outcome, Exception):
+            errors[key] = outcome
+        elif isinstance(outcome, BaseException):
+            raise outcome
+        else:
+            results[key] = outcome
+    return results, errors
+
+
+class AsyncGooglePlaces(GooglePlaces):
+    """An asyncio wrapper around the Google Places Query API.
+
+    Every request method is a coroutine taking the same arguments as its
+    GooglePlaces counterpart. Blocking calls made later on the returned
+    objects (e.g. Place.get_details()) still go through the synchronous
+    `session`; use fetch_details() to load details concurrently instead.
+
+    search_area is not a coroutine: it returns the blocking, thread pooled
+    area.AreaSearchResult of GooglePlaces, and iterating it from a coroutine
+    blocks the event loop (consume it with loop.run_in_executor).
+    """
+
+    def __init__(self, api_key, async_session=None, session=None,
+                 max_concurrency=100, details_cache=None,
+                 page_token_poller=None, rate_limiter=None, geocode_cache=None):
+        """
+        keyword arguments:
+        api_key         -- A Google API key with Places activated against it.
+        async_session   -- The AsyncHTTPSession used by the coroutines
+                           (default: a new session limited to max_concurrency
+                           requests in flight).
+        session         -- The synchronous HTTPSession used by the result
+                           objects (default: the shared default session).
+        max_concurrency -- Concurrency limit of the default async_session.
+        details_cache   -- An optional cache.PlaceDetailsCache consulted before
+                           every place details request (default None).
+        page_token_poller -- The PageTokenPoller that times retries of a
+                           next_page_token which is not active yet.
+        rate_limiter    -- An optional ratelimit.RateLimiter shared by the
+                           coroutines and the synchronous result objects.
+        geocode_cache   -- An optional cache.GeocodeCache consulted before every
+                           location= geocode request.
+        """
+        super(AsyncGooglePlaces, self).__init__(
+                api_key, session=session, details_cache=details_cache,
+                page_token_poller=page_token_poller, rate_limiter=rate_limiter,
+                geocode_cache=geocode_cache)
+        self._async_session = (async_session if async_session is not None else
+                               AsyncHTTPSession(max_concurrency=max_concurrency))
+
+    async def nearby_search(self, language=lang.ENGLISH, keyword=None,
+                            location=None, lat_lng=None, name=None,
+                            radius=3200, rankby=ranking.PROMINENCE,
+                            sensor=False, type=None, types=[], pagetoken=None):
+        """Coroutine version of GooglePlaces.nearby_search.
+
+        Follow-up pages are awaited before the result is returned.
+        """
+        lat_lng = await self._resolve_lat_lng(lat_lng, location)
+        request_params = self._nearby_search_params(
+                language=language, keyword=keyword, lat_lng=lat_lng,
+                name=name, radius=radius, rankby=rankby, sensor=sensor,
+                types=types, pagetoken=pagetoken)
+        fetch = lambda: _fetch_remote_json_async(
+                GooglePlaces.NEARBY_SEARCH_API_URL, request_params,
+                session=self.async_session,
+                rate_limiter=self.rate_limiter)
+        if pagetoken is not None:
+            url, places_response = await _poll_page_token_async(
+                    self.page_token_poller, fetch)
+        else:
+            url, places_response = await fetch()
+        _validate_response(url, places_response)
+        self._request_params = request_params
+        result = GooglePlacesSearchResult(self, places_response,
+                                          fetch_next_pages=False)
+        if pagetoken is None:
+            await self._get_next_pages(result)
+        return result
+
+    async def text_search(self, query, language=lang.ENGLISH, lat_lng=None,
+                          radius=3200, types=[], location=None):
+        """Coroutine version of GooglePlaces.text_search."""
+        lat_lng = await self._resolve_lat_lng(lat_lng, location)
+        request_params = self._text_search_params(
+                query, language=language, lat_lng=lat_lng, radius=radius,
+                types=types)
+        url, places_response = await _fetch_remote_json_async(
+                GooglePlaces.TEXT_SEARCH_API_URL, request_params,
+                session=self.async_session,
+                rate_limiter=self.rate_limiter)
+        _validate_response(url, places_response)
+        self._request_params = request_params
+        return GooglePlacesSearchResult(self, places_response,
+                                        fetch_next_pages=False)
+
+    async def autocomplete(self, input, lat_lng=None, location=None,
+                           radius=3200, language=lang.ENGLISH, types=None,
+                           components=[]):
+        """Coroutine version of GooglePlaces.autocomplete."""
+        lat_lng = await self._resolve_lat_lng(lat_lng, location)
+        request_params = self._autocomplete_params(
+                input, lat_lng=lat_lng, radius=radius, language=language,
+                types=types, components=components)
+        url, places_response = await _fetch_remote_json_async(
+                GooglePlaces.AUTOCOMPLETE_API_URL, request_params,
+                session=self.async_session,
+                rate_limiter=self.rate_limiter)
+        _validate_response(url, places_response)
+        self._request_params = request_params
+        return GoogleAutocompleteSearchResult(self, places_response)
+
+    async def radar_search(self, sensor=False, keyword=None, name=None,
+                           language=lang.ENGLISH, lat_lng=None, opennow=False,
+                           radius=3200, types=[], location=None):
+        """Coroutine version of GooglePlaces.radar_search."""
+        if keyword is None and name is None and len(types) == 0:
+            raise ValueError('One of keyword, name or types must be supplied.')
+        lat_lng = await self._resolve_lat_lng(lat_lng, location)
+        request_params = self._radar_search_params(
+                sensor=sensor, keyword=keyword, name=name, language=language,
+                lat_lng=lat_lng, opennow=opennow, radius=radius, types=types)
+        url, places_response = await _fetch_remote_json_async(
+                GooglePlaces.RADAR_SEARCH_API_URL, request_params,
+                session=self.async_session,
+                rate_limiter=self.rate_limiter)
+        _validate_response(url, places_response)
+        self._request_params = request_params
+        return GooglePlacesSearchResult(self, places_response,
+                                        fetch_next_pages=False)
+
+    async def checkin(self, place_id, sensor=False):
+        """Coroutine version of GooglePlaces.checkin."""
+        data = {'placeid': place_id}
+        url, checkin_response = await _fetch_remote_json_async(
+                GooglePlaces.CHECKIN_API_URL % (str(sensor).lower(),
+                        self.api_key), JSONBackend.dumps(data), use_http_post=True,
+                session=self.async_session,
+                rate_limiter=self.rate_limiter)
+        _validate_response(url, checkin_response)
+
+    async def get_place(self, place_id, sensor=False, language=lang.ENGLISH):
+        """Coroutine version of GooglePlaces.get_place."""
+        place_details = await _get_place_details_async(
+                place_id, self.api_key, sensor, language=language,
+                session=self.async_session, cache=self.details_cache,
+                rate_limiter=self.rate_limiter)
+        return Place(self, place_details)
+
+    async def add_place(self, **kwargs):
+        """Coroutine version of GooglePlaces.add_place."""
+        sensor, request_params = self._add_place_params(kwargs)
+        url, add_response = await _fetch_remote_json_async(
+                GooglePlaces.ADD_API_URL % (str(sensor).lower(),
+                self.api_key), JSONBackend.dumps(request_params), use_http_post=True,
+                session=self.async_session,
+                rate_limiter=self.rate_limiter)
+        _validate_response(url, add_response)
+        return {'place_id': add_response['place_id'],
+                'id': add_response['id']}
+
+    async def delete_place(self, place_id, sensor=False):
+        """Coroutine version of GooglePlaces.delete_place."""
+        request_params = {'place_id': place_id}
+        url, delete_response = await _fetch_remote_json_async(
+                GooglePlaces.DELETE_API_URL % (str(sensor).lower(),
+                self.api_key), JSONBackend.dumps(request_params), use_http_post=True,
+                session=self.async_session,
+                rate_limiter=self.rate_limiter)
+        _validate_response(url, delete_response)
+
+    async def get_details(self, place, language=None):
+        """Coroutine version of Place.get_details for a single place."""
+        if place._details is None:
+            if language is None:
+                language = (self._request_params or {}).get('language',
+                                                            lang.ENGLISH)
+            place._details = await _get_place_details_async(
+                    place.place_id, self.api_key, self.sensor,
+                    language=language, session=self.async_session,
+                    cache=self.details_cache,
+                    rate_limiter=self.rate_limiter)
+        return place
+
+    async def fetch_details(self, places, language=None):
+        """Loads the details of every place concurrently.
+
+        The number of requests in flight is bounded by the async session.
+        """
+        await asyncio.gather(*[self.get_details(place, language=language)
+                               for place in places])
+        return places
+
+    async def get_places(self, place_ids, sensor=False, language=lang.ENGLISH,
+                         max_workers=10):
+        """Coroutine version of GooglePlaces.get_places; returns a tuple
+        (places, errors). max_workers bounds the requests in flight."""
+        semaphore = asyncio.Semaphore(max_workers)
+        unique_ids = list(collections.OrderedDict.fromkeys(place_ids))
+
+        async def fetch(place_id):
+            async with semaphore:
+                return await _get_place_details_async(
+                        place_id, self.api_key, sensor, language=language,
+                        session=self.async_session, cache=self.details_cache,
+                        rate_limiter=self.rate_limiter)
+
+        details, errors = await _gather_by_key(unique_ids, fetch)
+        places = [Place(self, details[place_id]) for place_id in place_ids
+                  if place_id in details]
+        return places, errors
+
+    async def geocode(self, locations, max_workers=10):
+        """Coroutine version of GooglePlaces.geocode; returns a tuple
+        (lat_lngs, errors) keyed by the given location strings."""
+        semaphore = asyncio.Semaphore(max_workers)
+        by_address = collections.OrderedDict()
+        for location in locations:
+            by_address.setdefault(normalize_address(location), []).append(location)
+
+        async def fetch(address):
+            async with semaphore:
+                return await geocode_location_async(
+                        by_address[address][0], self.sensor,
+                        session=self.async_session,
+                        rate_limiter=self.rate_limiter, cache=self.geocode_cache)
+
+        results, failures = await _gather_by_key(list(by_address), fetch)
+        lat_lngs = dict((location, results[address])
+                        for address in results for location in by_address[address])
+        errors = dict((location, failures[address])
+                      for address in failures for location in by_address[address])
+        return lat_lngs, errors
+
+    async def get_photo(self, photo, maxheight=None, maxwidth=None,
+                        sensor=False):
+        """Coroutine version of Photo.get."""
+        if not maxheight and not maxwidth:
+            raise GooglePlacesError('You must specify maxheight or maxwidth!')
+        result = await _fetch_remote_file_async(
+                GooglePlaces.PHOTO_API_URL,
+                _place_photo_params(photo.photo_reference, self.api_key,
+                                    maxheight, maxwidth, sensor),
+                session=self.async_session,
+                rate_limiter=self.rate_limiter)
+        photo.mimetype, photo.filename, photo.data, photo.url = result
+        return photo
+
+    async def close(self):
+        await self.async_session.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+    async def _resolve_lat_lng(self, lat_lng, location):
+        if lat_lng is None and location is not None:
+            return await geocode_location_async(location,
+                                                session=self.async_session,
+                                                rate_limiter=self.rate_limiter,
+                                                cache=self.geocode_cache)
+        return lat_lng
+
+    async def _get_next_pages(self, result):
+        next_google_places = AsyncGooglePlaces(
+                self.api_key, async_session=self.async_session,
+                session=self.session, details_cache=self.details_cache,
+                page_token_poller=self.page_token_poller,
+                rate_limiter=self.rate_limiter, geocode_cache=self.geocode_cache)
+        while result.has_next_page_token:
+            additional_places = await next_google_places.nearby_search(
+                    pagetoken=result.next_page_token)
+            result._add_page(additional_places)
+
+    @property
+    def async_session(self):
+        return self._async_session
@@ -14,8 +14,9 @@ production environment.
 """
 from __future__ import absolute_import
 import cgi
-from decimal import Decimal
 import collections
+import concurrent.futures
+import itertools
 import time
 
 try:
@@ -33,10 +34,15 @@ import warnings
 
 from . import lang
 from . import ranking
+from . import projection
+from . import ratelimit
+from .cache import normalize_address
+from HTTPTransport import JSONBackend
+from HTTPTransport.HTTPSession import default_session
 
 
 __all__ = ['GooglePlaces', 'GooglePlacesError', 'GooglePlacesAttributeError',
-           'geocode_location']
+           'geocode_location', 'geocode_locations']
 __version__ = '1.2.0'
 __author__ = 'Samuel Adu'
 __email__ = 'sam@slimkrazy.com'
@@ -51,7 +57,8 @@ class cached_property(object):
         return result
 
 
-def _fetch_remote(service_url, params={}, use_http_post=False):
+def _encode_request(service_url, params={}, use_http_post=False):
+    """Returns a tuple (request_url, post_data) for the given parameters."""
     encoded_data = {}
     for k, v in params.items():
         if isinstance(v, six.string_types):
@@ -62,27 +69,62 @@ def _fetch_remote(service_url, params={}, use_http_post=False):
     if not use_http_post:
         query_url = (service_url if service_url.endswith('?') else
                      '%s?' % service_url)
-        request_url = query_url + encoded_data
-        request = urllib.request.Request(request_url)
-    else:
-        request_url = service_url
-        request = urllib.request.Request(service_url, data=encoded_data)
-    return (request_url, urllib.request.urlopen(request))
-
-def _fetch_remote_json(service_url, params={}, use_http_post=False):
-    """Retrieves a JSON object from a URL."""
-    request_url, response = _fetch_remote(service_url, params, use_http_post)
-    if six.PY3:
-        str_response = response.read().decode('utf-8')
-        return (request_url, json.loads(str_response, parse_float=Decimal))
-    return (request_url, json.load(response, parse_float=Decimal))
-
-def _fetch_remote_file(service_url, params={}, use_http_post=False):
-    """Retrieves a file from a URL.
+        return (query_url + encoded_data, None)
+    return (service_url, encoded_data)
+
+def _endpoint_for(service_url):
+    """Returns the ratelimit endpoint name a service url is limited under."""
+    return {GooglePlaces.NEARBY_SEARCH_API_URL: ratelimit.NEARBY,
+            GooglePlaces.TEXT_SEARCH_API_URL: ratelimit.TEXT,
+            GooglePlaces.RADAR_SEARCH_API_URL: ratelimit.RADAR,
+            GooglePlaces.DETAIL_API_URL: ratelimit.DETAILS,
+            GooglePlaces.PHOTO_API_URL: ratelimit.PHOTO,
+            GooglePlaces.AUTOCOMPLETE_API_URL: ratelimit.AUTOCOMPLETE,
+            GooglePlaces.GEOCODE_API_URL: ratelimit.GEOCODE}.get(
+                    service_url, ratelimit.OTHER)
+
+def _rate_limit_delay(rate_limiter, endpoint):
+    """Books a request with the rate limiter and returns the seconds to wait.
 
-    Returns a tuple (mimetype, filename, data)
+    raises:
+    GooglePlacesError -- if the daily quota budget is exhausted.
     """
-    request_url, response = _fetch_remote(service_url, params, use_http_post)
+    delay = rate_limiter.reserve(endpoint)
+    if delay is None:
+        raise GooglePlacesError('The daily quota budget of %s requests is '
+                                'exhausted.' % rate_limiter.daily_quota)
+    return delay
+
+def _is_over_query_limit(rate_limiter, endpoint, response, retries):
+    """Reports the response status to the rate limiter; returns True when an
+    OVER_QUERY_LIMIT response should be retried."""
+    if response.get('status') != GooglePlaces.RESPONSE_STATUS_OVER_QUERY_LIMIT:
+        rate_limiter.success(endpoint)
+        return False
+    rate_limiter.over_query_limit(endpoint)
+    return retries < rate_limiter.max_retries
+
+def _fetch_remote(service_url, params={}, use_http_post=False, session=None,
+                  rate_limiter=None):
+    session = session if session is not None else default_session()
+    if rate_limiter is not None:
+        delay = _rate_limit_delay(rate_limiter, _endpoint_for(service_url))
+        if delay > 0:
+            time.sleep(delay)
+    request_url, data = _encode_request(service_url, params, use_http_post)
+    return (request_url, session.urlopen(request_url, data=data))
+
+def _parse_json_response(response):
+    """Parses a JSON response with the selected HTTPTransport.JSONBackend;
+    floats are parsed as Decimal only if JSONBackend.set_backend(
+    use_decimal=True) was called."""
+    return JSONBackend.loads(response.read())
+
+def _encode_json(obj):
+    """Compact JSON encoding that writes Decimal values as numbers."""
+    return JSONBackend.dumps(obj)
+
+def _parse_file_response(response):
     dummy, params = cgi.parse_header(
             response.headers.get('Content-Disposition', ''))
     fn = params['filename']
@@ -90,7 +132,36 @@ def _fetch_remote_file(service_url, params={}, use_http_post=False):
     return (response.headers.get('content-type'),
             fn, response.read(), response.geturl())
 
-def geocode_location(location, sensor=False):
+def _fetch_remote_json(service_url, params={}, use_http_post=False, session=None,
+                       rate_limiter=None):
+    """Retrieves a JSON object from a URL.
+
+    With a rate_limiter, OVER_QUERY_LIMIT responses make the limiter back off
+    and the request is retried up to rate_limiter.max_retries times.
+    """
+    retries = 0
+    while True:
+        request_url, response = _fetch_remote(service_url, params,
+                                              use_http_post, session,
+                                              rate_limiter)
+        json_response = _parse_json_response(response)
+        if rate_limiter is None or not _is_over_query_limit(
+                rate_limiter, _endpoint_for(service_url), json_response, retries):
+            return (request_url, json_response)
+        retries += 1
+
+def _fetch_remote_file(service_url, params={}, use_http_post=False, session=None,
+                       rate_limiter=None):
+    """Retrieves a file from a URL.
+
+    Returns a tuple (mimetype, filename, data)
+    """
+    request_url, response = _fetch_remote(service_url, params, use_http_post,
+                                          session, rate_limiter)
+    return _parse_file_response(response)
+
+def geocode_location(location, sensor=False, session=None, rate_limiter=None,
+                     cache=None):
     """Converts a human-readable location to lat-lng.
 
     Returns a dict with lat and lng keys.
@@ -99,38 +170,140 @@ def geocode_location(location, sensor=False):
     location -- A human-readable location, e.g 'London, England'
     sensor   -- Boolean flag denoting if the location came from a device using
                 its' location sensor (default False)
+    session  -- The HTTPSession to send the request through (default: the
+                shared default session)
+    rate_limiter -- An optional ratelimit.RateLimiter the request is booked
+                with (default None)
+    cache    -- An optional cache.GeocodeCache consulted before, and filled
+                after, the geocode request (default None)
 
     raises:
     GooglePlacesError -- if the geocoder fails to find a location.
     """
-
+    if cache is not None:
+        cached_location = cache.get_location(location)
+        if cached_location is not None:
+            return cached_location
     url, geo_response = _fetch_remote_json(
             GooglePlaces.GEOCODE_API_URL,
-            {'address': location, 'sensor': str(sensor).lower()})
+            {'address': location, 'sensor': str(sensor).lower()},
+            session=session, rate_limiter=rate_limiter)
     _validate_response(url, geo_response)
     if geo_response['status'] == GooglePlaces.RESPONSE_STATUS_ZERO_RESULTS:
         error_detail = ('Lat/Lng for location \'%s\' can\'t be determined.' %
                         location)
         raise GooglePlacesError(error_detail)
-    return geo_response['results'][0]['geometry']['location']
+    lat_lng = geo_response['results'][0]['geometry']['location']
+    if cache is not None:
+        cache.set_location(location, lat_lng)
+    return lat_lng
+
+def geocode_locations(locations, sensor=False, session=None, max_workers=10,
+                      rate_limiter=None, cache=None):
+    """Converts many human-readable locations to lat-lng concurrently.
+
+    Returns a tuple (lat_lngs, errors), both dicts keyed by the given location
+    strings. Addresses that only differ in case or spacing are geocoded once.
+
+    keyword arguments:
+    locations   -- An iterable of human-readable locations.
+    max_workers -- The maximum number of requests in flight (default 10).
+    cache       -- An optional cache.GeocodeCache (default None).
+    """
+    by_address = collections.defaultdict(list)
+    for location in locations:
+        by_address[normalize_address(location)].append(location)
+    lat_lngs = {}
+    errors = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = dict((executor.submit(geocode_location, group[0], sensor,
+                                        session, rate_limiter, cache),
+                        group)
+                       for group in by_address.values())
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                lat_lng = future.result()
+            except Exception as e:
+                errors.update((location, e) for location in futures[future])
+            else:
+                lat_lngs.update((location, lat_lng) for location in futures[future])
+    return lat_lngs, errors
+
+def _place_details_params(place_id, api_key, sensor=False,
+                          language=lang.ENGLISH):
+    return {'placeid': place_id,
+            'sensor': str(sensor).lower(),
+            'key': api_key,
+            'language': language}
 
 def _get_place_details(place_id, api_key, sensor=False,
-                       language=lang.ENGLISH):
+                       language=lang.ENGLISH, session=None, cache=None,
+                       rate_limiter=None):
     """Gets a detailed place response.
 
     keyword arguments:
     place_id -- The unique identifier for the required place.
+    cache    -- An optional PlaceDetailsCache consulted before, and filled
+                after, the details request (default None).
     """
+    if cache is not None:
+        cached_details = cache.get_details(place_id, language)
+        if cached_details is not None:
+            return cached_details
     url, detail_response = _fetch_remote_json(GooglePlaces.DETAIL_API_URL,
-                                              {'placeid': place_id,
-                                               'sensor': str(sensor).lower(),
-                                               'key': api_key,
-                                               'language': language})
+                                              _place_details_params(place_id, api_key,
+                                                                    sensor, language),
+                                              session=session,
+                                              rate_limiter=rate_limiter)
     _validate_response(url, detail_response)
+    if cache is not None:
+        cache.set_details(place_id, language, detail_response['result'])
     return detail_response['result']
 
+def _get_places_details(place_ids, api_key, sensor=False,
+                        language=lang.ENGLISH, session=None, max_workers=10,
+                        cache=None, rate_limiter=None):
+    """Gets detailed place responses for many places concurrently.
+
+    Returns a tuple (details, errors), both dicts keyed by place_id. A failed
+    request is reported in errors rather than aborting the whole batch.
+
+    keyword arguments:
+    place_ids   -- The unique identifiers for the required places.
+    max_workers -- The maximum number of requests in flight (default 10).
+    """
+    details = {}
+    errors = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = dict((executor.submit(_get_place_details, place_id, api_key,
+                                        sensor, language, session, cache,
+                                        rate_limiter),
+                        place_id)
+                       for place_id in set(place_ids))
+        for future in concurrent.futures.as_completed(futures):
+            place_id = futures[future]
+            try:
+                details[place_id] = future.result()
+            except Exception as e:
+                errors[place_id] = e
+    return details, errors
+
+def _place_photo_params(photoreference, api_key, maxheight=None, maxwidth=None,
+                        sensor=False):
+    params = {'photoreference': photoreference,
+              'sensor': str(sensor).lower(),
+              'key': api_key}
+
+    if maxheight:
+        params['maxheight'] = maxheight
+
+    if maxwidth:
+        params['maxwidth'] = maxwidth
+
+    return params
+
 def _get_place_photo(photoreference, api_key, maxheight=None, maxwidth=None,
-                       sensor=False):
+                       sensor=False, session=None, rate_limiter=None):
     """Gets a place's photo by reference.
     See detailed documentation at https://developers.google.com/places/documentation/photos
 
@@ -144,18 +317,10 @@ def _get_place_photo(photoreference, api_key, maxheight=None, maxwidth=None,
     You must specify one of this keyword arguments. Acceptable value is an
     integer between 1 and 1600.
     """
-
-    params = {'photoreference': photoreference,
-              'sensor': str(sensor).lower(),
-              'key': api_key}
-
-    if maxheight:
-        params['maxheight'] = maxheight
-
-    if maxwidth:
-        params['maxwidth'] = maxwidth
-
-    return _fetch_remote_file(GooglePlaces.PHOTO_API_URL, params)
+    params = _place_photo_params(photoreference, api_key, maxheight, maxwidth,
+                                 sensor)
+    return _fetch_remote_file(GooglePlaces.PHOTO_API_URL, params, session=session,
+                              rate_limiter=rate_limiter)
 
 def _validate_response(url, response):
     """Validates that the response from Google was successful."""
@@ -166,6 +331,52 @@ def _validate_response(url, response):
         raise GooglePlacesError(error_detail)
 
 
+class PageTokenPoller(object):
+    """Backoff schedule for requesting a next_page_token that is not active yet.
+
+    Google answers INVALID_REQUEST until a freshly issued next_page_token
+    becomes valid, usually within about 2 seconds. The poller retries after
+    short, growing delays and gives up once max_wait seconds have been spent.
+
+    keyword arguments:
+    initial_delay -- The first delay in seconds (default 0.5).
+    backoff       -- The factor each following delay grows by (default 1.5).
+    max_delay     -- The upper bound of a single delay (default 4.0).
+    max_wait      -- The upper bound of the total time spent waiting on one
+                     token (default 30.0).
+    """
+
+    def __init__(self, initial_delay=0.5, backoff=1.5, max_delay=4.0,
+                 max_wait=30.0):
+        self.initial_delay = initial_delay
+        self.backoff = backoff
+        self.max_delay = max_delay
+        self.max_wait = max_wait
+
+    def delays(self):
+        """Yields the successive delays, stopping at max_wait in total."""
+        waited = 0.0
+        delay = self.initial_delay
+        while waited < self.max_wait:
+            delay = min(delay, self.max_delay, self.max_wait - waited)
+            yield delay
+            waited += delay
+            delay *= self.backoff
+
+    def poll(self, fetch):
+        """Calls fetch() until its response is no longer INVALID_REQUEST.
+
+        fetch must return a tuple (url, response); the last one is returned.
+        """
+        url, response = fetch()
+        for delay in self.delays():
+            if response['status'] != 'INVALID_REQUEST':
+                break
+            time.sleep(delay)
+            url, response = fetch()
+        return url, response
+
+
 class GooglePlacesError(Exception):
     pass
 
@@ -207,11 +418,38 @@ class GooglePlaces(object):
     MAXIMUM_SEARCH_RADIUS = 50000
     RESPONSE_STATUS_OK = 'OK'
     RESPONSE_STATUS_ZERO_RESULTS = 'ZERO_RESULTS'
+    RESPONSE_STATUS_OVER_QUERY_LIMIT = 'OVER_QUERY_LIMIT'
 
-    def __init__(self, api_key):
+    def __init__(self, api_key, session=None, details_cache=None,
+                 page_token_poller=None, rate_limiter=None, geocode_cache=None):
+        """
+        keyword arguments:
+        api_key       -- A Google API key with Places activated against it.
+        session       -- An HTTPTransport HTTPSession whose keep-alive
+                         connection pool is used for every request; may be
+                         shared with an AGOLHandler (default: the shared
+                         default session).
+        details_cache -- An optional cache.PlaceDetailsCache consulted before
+                         every place details request (default None).
+        page_token_poller -- The PageTokenPoller that times retries of a
+                         next_page_token which is not active yet (default
+                         PageTokenPoller()).
+        rate_limiter  -- An optional ratelimit.RateLimiter enforcing per-endpoint
+                         QPS limits and a daily quota budget, and backing off on
+                         OVER_QUERY_LIMIT; share one between instances that
+                         harvest concurrently (default None).
+        geocode_cache -- An optional cache.GeocodeCache consulted before every
+                         location= geocode request (default None).
+        """
         self._api_key = api_key
         self._sensor = False
         self._request_params = None
+        self._session = session if session is not None else default_session()
+        self._details_cache = details_cache
+        self._page_token_poller = (page_token_poller if page_token_poller
+                                   is not None else PageTokenPoller())
+        self._rate_limiter = rate_limiter
+        self._geocode_cache = geocode_cache
 
     def query(self, **kwargs):
         with warnings.catch_warnings():
@@ -222,7 +460,7 @@ class GooglePlaces(object):
 
     def nearby_search(self, language=lang.ENGLISH, keyword=None, location=None,
                lat_lng=None, name=None, radius=3200, rankby=ranking.PROMINENCE,
-               sensor=False, type=None, types=[], pagetoken=None):
+               sensor=False, type=None, types=[], pagetoken=None, lazy=False):
         """Perform a nearby search using the Google Places API.
 
         One of either location or lat_lng are required, the rest of the keyword
@@ -250,46 +488,59 @@ class GooglePlaces(object):
                     device using a location sensor (default False).
         types    -- An optional list of types, restricting the results to
                     Places (default []).
+        lazy     -- When True the following result pages are only requested
+                    as the result's places iterator reaches them, instead of
+                    all being loaded before this method returns (default False).
         """
-        if location is None and lat_lng is None and pagetoken is None:
-            raise ValueError('One of location or lat_lng must be passed in.')
-        if rankby == 'distance':
-            # As per API docs rankby == distance:
-            #  One or more of keyword, name, or types is required.
-            if keyword is None and types == [] and name is None:
-                raise ValueError('When rankby = googleplaces.ranking.DISTANCE, ' +
-                                 'name, keyword or types kwargs ' +
-                                 'must be specified.')
-        self._sensor = sensor
-        radius = (radius if radius <= GooglePlaces.MAXIMUM_SEARCH_RADIUS
-                  else GooglePlaces.MAXIMUM_SEARCH_RADIUS)
-        lat_lng_str = self._generate_lat_lng_string(lat_lng, location)
-
-        self._request_params = {}
-        if lat_lng_str is not None: self._request_params['location'] = lat_lng_str
-        if rankby == 'prominence':
-            self._request_params['radius'] = radius
-        else:
-            self._request_params['rankby'] = rankby
-        if len(types) > 0:
-            self._request_params['types'] = '|'.join(types)
-        if keyword is not None:
-            self._request_params['keyword'] = keyword
-        if name is not None:
-            self._request_params['name'] = name
+        self._request_params = self._nearby_search_params(
+                language=language, keyword=keyword, location=location,
+                lat_lng=lat_lng, name=name, radius=radius, rankby=rankby,
+                sensor=sensor, types=types, pagetoken=pagetoken)
+        request_params = self._request_params
+        fetch = lambda: _fetch_remote_json(GooglePlaces.NEARBY_SEARCH_API_URL,
+                                           request_params, session=self.session,
+                                           rate_limiter=self.rate_limiter)
         if pagetoken is not None:
-            self._request_params['pagetoken'] = pagetoken
-        if language is not None:
-            self._request_params['language'] = language
-        self._add_required_param_keys()
-        url, places_response = _fetch_remote_json(
-                GooglePlaces.NEARBY_SEARCH_API_URL, self._request_params)
-        while places_response['status'] == 'INVALID_REQUEST':
-            time.sleep(30)
-            url, places_response = _fetch_remote_json(
-                GooglePlaces.NEARBY_SEARCH_API_URL, self._request_params)
+            # a fresh next_page_token answers INVALID_REQUEST until it is active
+            url, places_response = self.page_token_poller.poll(fetch)
+        else:
+            url, places_response = fetch()
         _validate_response(url, places_response)
-        return GooglePlacesSearchResult(self, places_response)
+        return GooglePlacesSearchResult(self, places_response, lazy=lazy)
+
+    def search_area(self, area, types=[], keyword=None, name=None,
+                    language=lang.ENGLISH, max_radius=MAXIMUM_SEARCH_RADIUS,
+                    min_radius=100, max_workers=8):
+        """Covers a whole region with concurrent nearby searches.
+
+        The region is tiled with overlapping search circles of max_radius;
+        every circle that comes back with the maximum of 60 results is split
+        into 7 circles of half the radius until min_radius is reached. Returns
+        an area.AreaSearchResult streaming the places de-duplicated by
+        place_id, with tiling statistics in its coverage property.
+
+        keyword arguments:
+        area        -- A bounding box (west, south, east, north) or a polygon
+                       as a list of (lng, lat) pairs or lat/lng dicts.
+        types       -- An optional list of types, restricting the results to
+                       Places (default []).
+        keyword     -- A term to be matched against all available fields
+                       (default None).
+        name        -- A term to be matched against the names of the Places
+                       (default None).
+        language    -- The language code, indicating in which language the
+                       results should be returned, if possible. (default lang.ENGLISH)
+        max_radius  -- The radius (in meters) of the initial tiles. The maximum
+                       is 50000 meters. (default 50000)
+        min_radius  -- The smallest radius a saturated tile is split down to
+                       (default 100).
+        max_workers -- The maximum number of tile searches in flight (default 8).
+        """
+        from .area import AreaSearchResult
+        return AreaSearchResult(self, area, types=types, keyword=keyword,
+                                name=name, language=language,
+                                max_radius=max_radius, min_radius=min_radius,
+                                max_workers=max_workers)
 
     def text_search(self, query, language=lang.ENGLISH, lat_lng=None,
                     radius=3200, types=[], location=None):
@@ -311,18 +562,13 @@ class GooglePlaces(object):
         types    -- An optional list of types, restricting the results to
                     Places (default []).
         """
-        self._request_params = {'query': query}
-        if lat_lng is not None or location is not None:
-            lat_lng_str = self._generate_lat_lng_string(lat_lng, location)
-            self._request_params['location'] = lat_lng_str
-        self._request_params['radius'] = radius
-        if len(types) > 0:
-            self._request_params['types'] = '|'.join(types)
-        if language is not None:
-            self._request_params['language'] = language
-        self._add_required_param_keys()
+        self._request_params = self._text_search_params(
+                query, language=language, lat_lng=lat_lng, radius=radius,
+                types=types, location=location)
         url, places_response = _fetch_remote_json(
-                GooglePlaces.TEXT_SEARCH_API_URL, self._request_params)
+                GooglePlaces.TEXT_SEARCH_API_URL, self._request_params,
+                session=self.session,
+                rate_limiter=self.rate_limiter)
         _validate_response(url, places_response)
         return GooglePlacesSearchResult(self, places_response)
 
@@ -355,21 +601,13 @@ class GooglePlaces(object):
                     * country: matches a country name or a two letter ISO 3166-1 country code.
                     eg: [('country','US')]
         """
-        self._request_params = {'input': input}
-        if lat_lng is not None or location is not None:
-            lat_lng_str = self._generate_lat_lng_string(lat_lng, location)
-            self._request_params['location'] = lat_lng_str
-        self._request_params['radius'] = radius
-        if types:
-            self._request_params['types'] = types
-        if len(components) > 0:
-            self._request_params['components'] = '|'.join(['{}:{}'.format(
-                                                     c[0],c[1]) for c in components])
-        if language is not None:
-            self._request_params['language'] = language
-        self._add_required_param_keys()
+        self._request_params = self._autocomplete_params(
+                input, lat_lng=lat_lng, location=location, radius=radius,
+                language=language, types=types, components=components)
         url, places_response = _fetch_remote_json(
-                GooglePlaces.AUTOCOMPLETE_API_URL, self._request_params)
+                GooglePlaces.AUTOCOMPLETE_API_URL, self._request_params,
+                session=self.session,
+                rate_limiter=self.rate_limiter)
         _validate_response(url, places_response)
         return GoogleAutocompleteSearchResult(self, places_response)
 
@@ -402,34 +640,14 @@ class GooglePlaces(object):
         types    -- An optional list of types, restricting the results to
                     Places (default []).
         """
-        if keyword is None and name is None and len(types) is 0:
-            raise ValueError('One of keyword, name or types must be supplied.')
-        if location is None and lat_lng is None:
-            raise ValueError('One of location or lat_lng must be passed in.')
-        try:
-            radius = int(radius)
-        except:
-            raise ValueError('radius must be passed supplied as an integer.')
-        if sensor not in [True, False]:
-            raise ValueError('sensor must be passed in as a boolean value.')
-
-        self._request_params = {'radius': radius}
-        self._sensor = sensor
-        self._request_params['location'] = self._generate_lat_lng_string(
-                lat_lng, location)
-        if keyword is not None:
-            self._request_params['keyword'] = keyword
-        if name is not None:
-            self._request_params['name'] = name
-        if len(types) > 0:
-            self._request_params['types'] = '|'.join(types)
-        if language is not None:
-            self._request_params['language'] = language
-        if opennow is True:
-            self._request_params['opennow'] = 'true'
-        self._add_required_param_keys()
+        self._request_params = self._radar_search_params(
+                sensor=sensor, keyword=keyword, name=name, language=language,
+                lat_lng=lat_lng, opennow=opennow, radius=radius, types=types,
+                location=location)
         url, places_response = _fetch_remote_json(
-                GooglePlaces.RADAR_SEARCH_API_URL, self._request_params)
+                GooglePlaces.RADAR_SEARCH_API_URL, self._request_params,
+                session=self.session,
+                rate_limiter=self.rate_limiter)
         _validate_response(url, places_response)
         return GooglePlacesSearchResult(self, places_response)
 
@@ -444,7 +662,9 @@ class GooglePlaces(object):
         data = {'placeid': place_id}
         url, checkin_response = _fetch_remote_json(
                 GooglePlaces.CHECKIN_API_URL % (str(sensor).lower(),
-                        self.api_key), json.dumps(data), use_http_post=True)
+                        self.api_key), JSONBackend.dumps(data), use_http_post=True,
+                session=self.session,
+                rate_limiter=self.rate_limiter)
         _validate_response(url, checkin_response)
 
     def get_place(self, place_id, sensor=False, language=lang.ENGLISH):
@@ -458,9 +678,37 @@ class GooglePlaces(object):
                     results should be returned, if possible. (default lang.ENGLISH)
         """
         place_details = _get_place_details(place_id,
-                self.api_key, sensor, language=language)
+                self.api_key, sensor, language=language, session=self.session,
+                cache=self.details_cache,
+                rate_limiter=self.rate_limiter)
         return Place(self, place_details)
 
+    def get_places(self, place_ids, sensor=False, language=lang.ENGLISH,
+                   max_workers=10):
+        """Gets detailed place objects for many place_ids concurrently.
+
+        Returns a tuple (places, errors): the Place objects in the order of
+        place_ids, and a dict of place_id -> exception for every place whose
+        details request failed (those are left out of places).
+
+        keyword arguments:
+        place_ids   -- The unique Google identifiers for the required places.
+        sensor      -- Boolean flag denoting if the location came from a
+                       device using its' location sensor (default False).
+        language    -- The language code, indicating in which language the
+                       results should be returned, if possible. (default lang.ENGLISH)
+        max_workers -- The maximum number of requests in flight (default 10).
+        """
+        details, errors = _get_places_details(place_ids, self.api_key, sensor,
+                                              language=language,
+                                              session=self.session,
+                                              max_workers=max_workers,
+                                              cache=self.details_cache,
+                                              rate_limiter=self.rate_limiter)
+        places = [Place(self, details[place_id]) for place_id in place_ids
+                  if place_id in details]
+        return places, errors
+
     def add_place(self, **kwargs):
         """Adds a place to the Google Places database.
 
@@ -482,6 +730,36 @@ class GooglePlaces(object):
         sensor      -- Boolean flag denoting if the location came from a device
                        using its location sensor (default False).
         """
+        sensor, request_params = self._add_place_params(kwargs)
+        url, add_response = _fetch_remote_json(
+                GooglePlaces.ADD_API_URL % (str(sensor).lower(),
+                self.api_key), JSONBackend.dumps(request_params), use_http_post=True,
+                session=self.session,
+                rate_limiter=self.rate_limiter)
+        _validate_response(url, add_response)
+        return {'place_id': add_response['place_id'],
+                'id': add_response['id']}
+
+    def delete_place(self, place_id, sensor=False):
+        """Deletes a place from the Google Places database.
+
+        keyword arguments:
+        place_id   -- The textual identifier that uniquely identifies this
+                      Place, returned from a Place Search request.
+        sensor     -- Boolean flag denoting if the location came from a device
+                      using its location sensor (default False).
+        """
+
+        request_params = {'place_id': place_id}
+        url, delete_response = _fetch_remote_json(
+                GooglePlaces.DELETE_API_URL % (str(sensor).lower(),
+                self.api_key), JSONBackend.dumps(request_params), use_http_post=True,
+                session=self.session,
+                rate_limiter=self.rate_limiter)
+        _validate_response(url, delete_response)
+
+    def _add_place_params(self, kwargs):
+        """Validates add_place kwargs, returns a tuple (sensor, request_params)."""
         required_kwargs = {'name': [str], 'lat_lng': [dict],
                            'accuracy': [int], 'types': [str, list]}
         request_params = {}
@@ -523,37 +801,122 @@ class GooglePlaces(object):
             request_params['types'] = [kwargs['types']]
         else:
             request_params['types'] = kwargs['types']
-        url, add_response = _fetch_remote_json(
-                GooglePlaces.ADD_API_URL % (str(sensor).lower(),
-                self.api_key), json.dumps(request_params), use_http_post=True)
-        _validate_response(url, add_response)
-        return {'place_id': add_response['place_id'],
-                'id': add_response['id']}
+        return sensor, request_params
 
-    def delete_place(self, place_id, sensor=False):
-        """Deletes a place from the Google Places database.
+    def _nearby_search_params(self, language=lang.ENGLISH, keyword=None,
+                              location=None, lat_lng=None, name=None,
+                              radius=3200, rankby=ranking.PROMINENCE,
+                              sensor=False, types=[], pagetoken=None):
+        if location is None and lat_lng is None and pagetoken is None:
+            raise ValueError('One of location or lat_lng must be passed in.')
+        if rankby == 'distance':
+            # As per API docs rankby == distance:
+            #  One or more of keyword, name, or types is required.
+            if keyword is None and types == [] and name is None:
+                raise ValueError('When rankby = googleplaces.ranking.DISTANCE, ' +
+                                 'name, keyword or types kwargs ' +
+                                 'must be specified.')
+        self._sensor = sensor
+        radius = (radius if radius <= GooglePlaces.MAXIMUM_SEARCH_RADIUS
+                  else GooglePlaces.MAXIMUM_SEARCH_RADIUS)
 
-        keyword arguments:
-        place_id   -- The textual identifier that uniquely identifies this
-                      Place, returned from a Place Search request.
-        sensor     -- Boolean flag denoting if the location came from a device
-                      using its location sensor (default False).
-        """
+        request_params = {}
+        if lat_lng is not None or location is not None:
+            request_params['location'] = self._generate_lat_lng_string(
+                    lat_lng, location)
+        if rankby == 'prominence':
+            request_params['radius'] = radius
+        else:
+            request_params['rankby'] = rankby
+        if len(types) > 0:
+            request_params['types'] = '|'.join(types)
+        if keyword is not None:
+            request_params['keyword'] = keyword
+        if name is not None:
+            request_params['name'] = name
+        if pagetoken is not None:
+            request_params['pagetoken'] = pagetoken
+        if language is not None:
+            request_params['language'] = language
+        self._add_required_param_keys(request_params)
+        return request_params
 
-        request_params = {'place_id': place_id}
-        url, delete_response = _fetch_remote_json(
-                GooglePlaces.DELETE_API_URL % (str(sensor).lower(),
-                self.api_key), json.dumps(request_params), use_http_post=True)
-        _validate_response(url, delete_response)
+    def _text_search_params(self, query, language=lang.ENGLISH, lat_lng=None,
+                            radius=3200, types=[], location=None):
+        request_params = {'query': query}
+        if lat_lng is not None or location is not None:
+            lat_lng_str = self._generate_lat_lng_string(lat_lng, location)
+            request_params['location'] = lat_lng_str
+        request_params['radius'] = radius
+        if len(types) > 0:
+            request_params['types'] = '|'.join(types)
+        if language is not None:
+            request_params['language'] = language
+        self._add_required_param_keys(request_params)
+        return request_params
+
+    def _autocomplete_params(self, input, lat_lng=None, location=None,
+                             radius=3200, language=lang.ENGLISH, types=None,
+                             components=[]):
+        request_params = {'input': input}
+        if lat_lng is not None or location is not None:
+            lat_lng_str = self._generate_lat_lng_string(lat_lng, location)
+            request_params['location'] = lat_lng_str
+        request_params['radius'] = radius
+        if types:
+            request_params['types'] = types
+        if len(components) > 0:
+            request_params['components'] = '|'.join(['{}:{}'.format(
+                                                     c[0],c[1]) for c in components])
+        if language is not None:
+            request_params['language'] = language
+        self._add_required_param_keys(request_params)
+        return request_params
+
+    def _radar_search_params(self, sensor=False, keyword=None, name=None,
+                             language=lang.ENGLISH, lat_lng=None,
+                             opennow=False, radius=3200, types=[],
+                             location=None):
+        if keyword is None and name is None and len(types) is 0:
+            raise ValueError('One of keyword, name or types must be supplied.')
+        if location is None and lat_lng is None:
+            raise ValueError('One of location or lat_lng must be passed in.')
+        try:
+            radius = int(radius)
+        except:
+            raise ValueError('radius must be passed supplied as an integer.')
+        if sensor not in [True, False]:
+            raise ValueError('sensor must be passed in as a boolean value.')
 
-    def _add_required_param_keys(self):
-        self._request_params['key'] = self.api_key
-        self._request_params['sensor'] = str(self.sensor).lower()
+        request_params = {'radius': radius}
+        self._sensor = sensor
+        request_params['location'] = self._generate_lat_lng_string(
+                lat_lng, location)
+        if keyword is not None:
+            request_params['keyword'] = keyword
+        if name is not None:
+            request_params['name'] = name
+        if len(types) > 0:
+            request_params['types'] = '|'.join(types)
+        if language is not None:
+            request_params['language'] = language
+        if opennow is True:
+            request_params['opennow'] = 'true'
+        self._add_required_param_keys(request_params)
+        return request_params
+
+    def _add_required_param_keys(self, request_params=None):
+        if request_params is None:
+            request_params = self._request_params
+        request_params['key'] = self.api_key
+        request_params['sensor'] = str(self.sensor).lower()
 
     def _generate_lat_lng_string(self, lat_lng, location):
         try:
             return '%(lat)s,%(lng)s' % (lat_lng if lat_lng is not None
-                    else geocode_location(location))
+                    else geocode_location(location, session=self.session,
+                                          rate_limiter=self.rate_limiter,
+                                          cache=self.geocode_cache))
         except:
             raise ValueError(
                 'lat_lng must be a dict with the keys, \'lat\' and \'lng\'')
@@ -570,6 +933,34 @@ class GooglePlaces(object):
     def sensor(self):
         return self._sensor
 
+    @property
+    def session(self):
+        return self._session
+
+    @property
+    def details_cache(self):
+        return self._details_cache
+
+    @property
+    def page_token_poller(self):
+        return self._page_token_poller
+
+    @property
+    def rate_limiter(self):
+        return self._rate_limiter
+
+    @property
+    def geocode_cache(self):
+        return self._geocode_cache
+
+    def geocode(self, locations, max_workers=10):
+        """Geocodes many locations concurrently through the instance's session,
+        rate limiter and geocode cache; see geocode_locations."""
+        return geocode_locations(locations, self.sensor, session=self.session,
+                                 max_workers=max_workers,
+                                 rate_limiter=self.rate_limiter,
+                                 cache=self.geocode_cache)
+
 
 class GoogleAutocompleteSearchResult(object):
     """Wrapper around the Google Autocomplete API query JSON response."""
@@ -718,7 +1109,10 @@ class Prediction(object):
                     language = lang.ENGLISH
             place = _get_place_details(
                     self.place_id, self._query_instance.api_key,
-                    self._query_instance.sensor, language=language)
+                    self._query_instance.sensor, language=language,
+                    session=self._query_instance.session,
+                    cache=self._query_instance.details_cache,
+                    rate_limiter=self._query_instance.rate_limiter)
             self._place = Place(self._query_instance, place)
 
     def _validate_status(self):
@@ -740,7 +1134,8 @@ class GooglePlacesSearchResult(object):
     Wrapper around the Google Places API query JSON response.
     """
 
-    def __init__(self, query_instance, response):
+    def __init__(self, query_instance, response, fetch_next_pages=True,
+                 lazy=False):
         self._query_instance = query_instance
         self._response = response
         self._places = []
@@ -749,29 +1144,127 @@ class GooglePlacesSearchResult(object):
         self._html_attributions = response.get('html_attributions', [])
         self._next_page_token = response.get('next_page_token', '')
         self._agol_json = ''
-        if 'pagetoken' not in query_instance._request_params:
+        self._details_errors = {}
+        self._lazy = lazy
+        if lazy:
+            self._pages = self.iter_pages()
+            self._places_iterator = itertools.chain.from_iterable(self._pages)
+        elif fetch_next_pages and 'pagetoken' not in query_instance._request_params:
             print("I am 1st: {}\n\twith query: {}".format(self.__repr__(), query_instance._request_params))
             if self.has_next_page_token: self.get_next_pages()
 
     def get_next_pages(self):
-        api_key = self._query_instance.api_key
-        next_google_places = GooglePlaces(api_key)
+        next_google_places = self._next_google_places()
         while self.has_next_page_token:
             additional_places = next_google_places.nearby_search(pagetoken=self._next_page_token)
             print("I am: {}\n\twith query: {}".format(additional_places.__repr__(), additional_places._query_instance._request_params))
-            self._places += additional_places._places
-            print(len(self._places))
-            self._next_page_token = additional_places.next_page_token
+            self._add_page(additional_places)
         print("Total entries in places: {}".format(len(self._places)))
 
+    def iter_pages(self):
+        """Yields the places one page (list) at a time.
+
+        Each following page is requested only when the consumer asks for it,
+        and replaces the previous page in memory instead of being appended.
+        """
+        yield self._places
+        next_google_places = self._next_google_places()
+        while self.has_next_page_token:
+            additional_places = next_google_places.nearby_search(pagetoken=self._next_page_token)
+            self._places = additional_places._places
+            self._next_page_token = additional_places.next_page_token
+            yield self._places
+
+    def _next_google_places(self):
+        return GooglePlaces(self._query_instance.api_key,
+                            session=self._query_instance.session,
+                            details_cache=self._query_instance.details_cache,
+                            page_token_poller=self._query_instance.page_token_poller,
+                            rate_limiter=self._query_instance.rate_limiter,
+                            geocode_cache=self._query_instance.geocode_cache)
+
+    def fetch_all_details(self, max_workers=10, language=None):
+        """Retrieves full information on every place in the result concurrently.
+
+        Fills the details of each Place in place, exactly as if get_details()
+        had been called on it; places that already have details are skipped.
+        Returns a dict of place_id -> exception for the places whose details
+        request failed, without aborting the rest of the batch.
+
+        keyword arguments:
+        max_workers -- The maximum number of requests in flight (default 10).
+        language    -- The language code, indicating in which language the
+                       results should be returned, if possible. This value
+                       defaults to the language that was used to generate the
+                       GooglePlacesSearchResult instance.
+
+        In lazy mode only the page currently loaded is enriched.
+        """
+        if language is None:
+            language = (self._query_instance._request_params or {}).get(
+                    'language', lang.ENGLISH)
+        pending = [place for place in self._places if place._details is None]
+        details, errors = _get_places_details(
+                [place.place_id for place in pending],
+                self._query_instance.api_key, self._query_instance.sensor,
+                language=language, session=self._query_instance.session,
+                max_workers=max_workers,
+                cache=self._query_instance.details_cache,
+                rate_limiter=self._query_instance.rate_limiter)
+        for place in pending:
+            if place.place_id in details:
+                place._details = details[place.place_id]
+        return errors
+
+    def place_table(self):
+        """Returns the places as a columnar table.PlaceTable.
+
+        In lazy mode the remaining pages are requested and added to the table
+        one page at a time, so no list of Place objects is built.
+        """
+        from .table import PlaceTable
+        return PlaceTable.from_places(self.places, self._query_instance)
+
+    def _add_page(self, additional_places):
+        """Appends the places of a follow-up page and advances the page token."""
+        self._places += additional_places._places
+        print(len(self._places))
+        self._next_page_token = additional_places.next_page_token
+
     @property
     def agol_json(self):
         """
         creates JSON file compatible with agol feature services
+
+        Places whose details request failed are left out and reported in
+        details_errors instead of being requested again one by one.
+
+        In lazy mode the AGOL_JSON streams the remaining pages, loading the
+        details of each page as it is reached, and can be encoded only once.
         """
-        self._agol_json = AGOL_JSON(self._places)
+        self._details_errors = {}
+        if self._lazy:
+            self._agol_json = AGOL_JSON(self.__iter_places_with_details())
+            return self._agol_json
+        self._agol_json = AGOL_JSON(self.__places_with_details(self._places))
         return self._agol_json
 
+    def __places_with_details(self, places):
+        errors = self.fetch_all_details()
+        self._details_errors.update(errors)
+        return [place for place in places if place.place_id not in errors]
+
+    def __iter_places_with_details(self):
+        for page in self._pages:
+            for place in self.__places_with_details(page):
+                yield place
+
+    @property
+    def details_errors(self):
+        """dict of place_id -> exception for the places agol_json left out
+        because their details request failed."""
+        return self._details_errors
+
     @property
     def raw_response(self):
         """
@@ -781,8 +1274,16 @@ class GooglePlacesSearchResult(object):
 
     @property
     def places(self):
+        """Returns the list of places, or in lazy mode a one-pass iterator
+        that requests the following pages as it reaches them."""
+        if self._lazy:
+            return self._places_iterator
         return self._places
 
+    @property
+    def is_lazy(self):
+        return self._lazy
+
     @property
     def next_page_token(self):
         """Returns the next page token(next_page_token).
@@ -811,31 +1312,36 @@ class GooglePlacesSearchResult(object):
 
     def __repr__(self):
         """ Return a string representation stating the number of results."""
-        return '<{} with {} result(s)>'.format(self.__class__.__name__, len(self.places))
+        return '<{} with {} result(s)>'.format(self.__class__.__name__, len(self._places))
 
 
 class Place(object):
     """
     Represents a place from the results of a Google Places API query.
+
+    Only the place_data dict of the search result (and the details, once
+    fetched) is kept; every property reads from it, so a Place adds no copy of
+    its fields. See table.PlaceTable for a columnar container that holds
+    places without a Place object per result.
     """
+    __slots__ = ('_query_instance', '_place_data', '_details', '_photos')
+
     def __init__(self, query_instance, place_data):
         self._query_instance = query_instance
-        self._place_id = place_data['place_id']
-        self._id = place_data.get('id', 'none')
-        self._reference = place_data.get('reference', 'none')
-        self._name = place_data.get('name','none')
-        self._vicinity = place_data.get('vicinity', 'none')
-        self._geo_location = place_data['geometry']['location']
-        self._rating = place_data.get('rating','none')
-        self._types = place_data.get('types','none')
-        self._typesstring = ''
-        self._icon = place_data.get('icon','none')
-        self._opening_hours = place_data.get('opening_hours', {})
         if place_data.get('address_components') is None:
             self._details = None
         else:
             self._details = place_data
         self._place_data = place_data
+        self._photos = None
+
+    def _field(self, key, default='none'):
+        """Returns key of the search result, falling back to the details when
+        the search result left it empty."""
+        value = self._place_data.get(key, default)
+        if value == '' and self._details is not None and key in self._details:
+            value = self._details[key]
+        return value
 
     @property
     def reference(self):
@@ -853,7 +1359,7 @@ class Place(object):
         warnings.warn('The "reference" feature is deprecated and may'
                       'stop working any time after June 24, 2015.',
                       FutureWarning)
-        return self._reference
+        return self._place_data.get('reference', 'none')
 
     @property
     def id(self):
@@ -870,7 +1376,7 @@ class Place(object):
         warnings.warn('The "id" feature is deprecated and may'
                       'stop working any time after June 24, 2015.',
                       FutureWarning)
-        return self._id
+        return self._place_data.get('id', 'none')
 
     @property
     def place_id(self):
@@ -881,27 +1387,21 @@ class Place(object):
 
         This should be considered the primary identifier of a place.
         """
-        return self._place_id
+        return self._place_data['place_id']
 
     @property
     def icon(self):
         """Returns the URL of a recommended icon for display."""
-        if self._icon == '' and self.details != None and 'icon' in self.details:
-            self._icon = self.details['icon']
-        return self._icon
+        return self._field('icon')
 
     @property
     def types(self):
         """Returns a list of feature types describing the given result."""
-        if self._types == '' and self.details != None and 'types' in self.details:
-            self._icon = self.details['types']
-        return self._types
+        return self._field('types')
 
     @property
     def typesstring(self):
-        for type in self._types:
-            self._typesstring += str(type) + ', '
-        return self._typesstring[:-2]
+        return ', '.join(str(type) for type in self.types)
 
     @property
     def geo_location(self):
@@ -909,7 +1409,7 @@ class Place(object):
 
         A dict with the keys 'lat' and 'lng' will be returned.
         """
-        return self._geo_location
+        return self._place_data['geometry']['location']
 
     @property
     def place_data(self):
@@ -922,9 +1422,7 @@ class Place(object):
     @property
     def name(self):
         """Returns the human-readable name of the place."""
-        if self._name == '' and self.details != None and 'name' in self.details:
-            self._name = self.details['name']
-        return self._name
+        return self._field('name')
 
     @property
     def vicinity(self):
@@ -933,9 +1431,7 @@ class Place(object):
         Often this feature refers to a street or neighborhood within the given
         results.
         """
-        if self._vicinity == '' and self.details != None and 'vicinity' in self.details:
-            self._vicinity = self.details['vicinity']
-        return self._vicinity
+        return self._field('vicinity')
 
     @property
     def rating(self):
@@ -943,22 +1439,20 @@ class Place(object):
 
         This method will return None for places that have no rating.
         """
-        if self._rating == '' and self.details != None and 'rating' in self.details:
-            self._rating = self.details['rating']
-        return self._rating
+        return self._field('rating')
 
     @property
     def weekday_text(self):
         """Returns weekday text if present
         """
-        weekday_text = self._opening_hours.get('weekday_text', 'none')
+        weekday_text = self._place_data.get('opening_hours', {}).get('weekday_text', 'none')
         return weekday_text
 
     @property
     def open_now(self):
         """Returns boolean of open or not
         """
-        open_now = str(self._opening_hours.get('open_now', 'none'))
+        open_now = str(self._place_data.get('opening_hours', {}).get('open_now', 'none'))
         return open_now
 
     # The following properties require a further API call in order to be
@@ -1050,13 +1544,18 @@ class Place(object):
                     language = lang.ENGLISH
             self._details = _get_place_details(
                     self.place_id, self._query_instance.api_key,
-                    self._query_instance.sensor, language=language)
+                    self._query_instance.sensor, language=language,
+                    session=self._query_instance.session,
+                    cache=self._query_instance.details_cache,
+                    rate_limiter=self._query_instance.rate_limiter)
 
-    @cached_property
+    @property
     def photos(self):
-        self.get_details()
-        return map(lambda i: Photo(self._query_instance, i),
-                   self.details.get('photos', []))
+        if self._photos is None:
+            self.get_details()
+            self._photos = [Photo(self._query_instance, i)
+                            for i in self.details.get('photos', [])]
+        return self._photos
 
     def _validate_status(self):
         if self._details is None:
@@ -1090,20 +1589,36 @@ class Photo(object):
         result = _get_place_photo(self.photo_reference,
                                   self._query_instance.api_key,
                                   maxheight=maxheight, maxwidth=maxwidth,
-                                  sensor=sensor)
+                                  sensor=sensor,
+                                  session=self._query_instance.session,
+                                  rate_limiter=self._query_instance.rate_limiter)
 
         self.mimetype, self.filename, self.data, self.url = result
 
 
 class AGOL_JSON(object):
-    """Wrapper around the Google Places results to interact with AGOL wrapper."""
-    def __init__(self, places=None, features=None):
+    """Wrapper around the Google Places results to interact with AGOL wrapper.
+
+    Nothing is built up front: iter_agol_features()/iter_arcrest_features()
+    yield one feature at a time, write_agol_json()/write_arcrest_json() and
+    iter_encoded() stream the encoded JSON, and raw_agol_json/raw_arcrest_json
+    only build (and keep) the format that is asked for. places may be any
+    iterable, e.g. a lazy result's places iterator or a table.PlaceTable; a
+    one-pass iterator can only be streamed once.
+
+    Coordinates are converted batch_size places at a time with
+    projection.project (vectorized when NumPy is installed); pass
+    out_sr=3857 to emit Web Mercator instead of WGS84.
+    """
+
+    def __init__(self, places=None, features=None, out_sr=projection.WGS84,
+                 batch_size=1000):
         self._features = features
         self._places = places
-        self._agol_featurecollection = {}
-        self.__agol_featurecollection()
-        self._arcrest_featurelist = []
-        self.__arcrest_featurelist()
+        self._out_sr = projection.validate_wkid(out_sr)
+        self._batch_size = batch_size
+        self._agol_featurecollection = None
+        self._arcrest_featurelist = None
 
     def __place_details(self, place):
         if self._features:
@@ -1112,8 +1627,8 @@ class AGOL_JSON(object):
                              'properties': place['properties']}
         else:
             place.get_details()
-            place_details = {'geometry': {'longitude': float(place.geo_location['lng']),
-                                          'latitude': float(place.geo_location['lat'])},
+            place_details = {'geometry': {'longitude': place.geo_location['lng'],
+                                          'latitude': place.geo_location['lat']},
                              'properties': {"place_id": place.place_id,
                                             "name": place.name,
                                             "vicinity": place.vicinity,
@@ -1121,50 +1636,98 @@ class AGOL_JSON(object):
                                             "open_now": place.open_now}}
         return place_details
 
+    def __iter_place_details(self):
+        """Yields (place_details, x, y), converting the coordinates of each
+        batch of places in one projection.project call."""
+        places = iter((self._places if self._places else self._features) or [])
+        while True:
+            batch = [self.__place_details(place)
+                     for place in itertools.islice(places, self._batch_size)]
+            if not batch:
+                return
+            xs, ys = projection.project([place['geometry']['longitude'] for place in batch],
+                                        [place['geometry']['latitude'] for place in batch],
+                                        self._out_sr)
+            for place, x, y in zip(batch, xs, ys):
+                yield place, x, y
+
     """AGOL JSON functions"""
-    def __agol_featurelist(self):
-        agol_featurelist = []
-        places = self._places if self._places else self._features
-        for place in places:
-            agol_place =  self.__agol_place(self.__place_details(place))
-            agol_featurelist.append(agol_place)
-        return agol_featurelist
-
-    def __agol_place(self, place):
+    def iter_agol_features(self):
+        """Yields the places one GeoJSON feature at a time."""
+        for place, x, y in self.__iter_place_details():
+            yield self.__agol_place(place, x, y)
+
+    def __agol_place(self, place, x, y):
         agol_place = {"type": "Feature",
                       "geometry": {"type": "Point",
-                                   "coordinates": [place['geometry']['longitude'], place['geometry']['latitude']]},
+                                   "coordinates": [x, y]},
                       "properties": place['properties']}
         return agol_place
 
-    def __agol_featurecollection(self):
-        agol_featurelist = self.__agol_featurelist()
-        agol_featurecollection = {"type": "FeatureCollection",
-                                  "crs": {"type": "name",
-                                          "properties": {"name": "EPSG:4326"}},
-                                  "features": agol_featurelist}
-        self._agol_featurecollection = agol_featurecollection
-
     """ArcREST JSON functions"""
-    def __arcrest_featurelist(self):
-        arcrest_featurelist = []
-        places = self._places if self._places else self._features
-        for place in places:
-            arcrest_place = self.__arcrest_place(self.__place_details(place))
-            arcrest_featurelist.append(arcrest_place)
-        self._arcrest_featurelist = arcrest_featurelist
-
-    def __arcrest_place(self, place):
+    def iter_arcrest_features(self):
+        """Yields the places one ArcGIS JSON feature at a time."""
+        for place, x, y in self.__iter_place_details():
+            yield self.__arcrest_place(place, x, y)
+
+    def __arcrest_place(self, place, x, y):
         arcrest_place = {
-                      "geometry": {"x": place['geometry']['longitude'],
-                                   "y": place['geometry']['latitude'],
-                                   "spatialReference": {'wkid': 4326}},
+                      "geometry": {"x": x,
+                                   "y": y,
+                                   "spatialReference": projection.SPATIAL_REFERENCES[self._out_sr]},
                       "attributes": place['properties']}
         return arcrest_place
 
-    def write_jsonfile(self, raw_json, filename='./json_file'):
+    """Streaming encoders"""
+    def iter_encoded(self, output_format='arcrest'):
+        """Yields the JSON text of the chosen format in small pieces, one per
+        feature, so it can be written to a file or request body as produced.
+
+        output_format -- 'arcrest' for a list of ArcGIS JSON features (what
+                         addFeatures expects) or 'geojson' for a
+                         FeatureCollection (default 'arcrest').
+        """
+        if output_format == 'geojson':
+            features = self.iter_agol_features()
+            yield '{"type": "FeatureCollection", "crs": %s, "features": [' % (
+                    _encode_json(self.geojson_crs))
+        elif output_format == 'arcrest':
+            features = self.iter_arcrest_features()
+            yield '['
+        else:
+            raise ValueError("output_format must be 'arcrest' or 'geojson'")
+        separator = ''
+        for feature in features:
+            yield separator + _encode_json(feature)
+            separator = ', '
+        yield ']}' if output_format == 'geojson' else ']'
+
+    def write(self, outfile, output_format='arcrest'):
+        """Streams the chosen format into a text file object or file path."""
+        if isinstance(outfile, six.string_types):
+            with open(outfile, 'w') as f:
+                return self.write(f, output_format)
+        for piece in self.iter_encoded(output_format):
+            outfile.write(piece)
+
+    def write_agol_json(self, outfile):
+        self.write(outfile, 'geojson')
+
+    def write_arcrest_json(self, outfile):
+        self.write(outfile, 'arcrest')
+
+    def write_jsonfile(self, raw_json, filename='./json_file', compact=False):
         with open(filename + '.json', 'w') as outfile:
-            json.dump(raw_json, outfile, sort_keys=False, indent=4, ensure_ascii=False)
+            JSONBackend.dump(raw_json, outfile, indent=None if compact else 4)
+
+    @property
+    def out_sr(self):
+        return self._out_sr
+
+    @property
+    def geojson_crs(self):
+        return {"type": "name",
+                "properties": {"name": projection.GEOJSON_CRS_NAMES[self._out_sr]}}
 
     @property
     def raw_places(self):
@@ -1176,8 +1739,14 @@ class AGOL_JSON(object):
 
     @property
     def raw_agol_json(self):
+        if self._agol_featurecollection is None:
+            self._agol_featurecollection = {"type": "FeatureCollection",
+                                            "crs": self.geojson_crs,
+                                            "features": list(self.iter_agol_features())}
         return self._agol_featurecollection
 
     @property
     def raw_arcrest_json(self):
-        return self._arcrest_featurelist
\ No newline at end of file
+        if self._arcrest_featurelist is None:
+            self._arcrest_featurelist = list(self.iter_arcrest_features())
+        return self._arcrest_featurelist
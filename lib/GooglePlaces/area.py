@@ -0,0 +1,308 @@
+"""
+Area-coverage search on top of nearby_search.
+
+A single nearby search is limited to MAXIMUM_SEARCH_RADIUS and 60 results.
+AreaSearchResult covers a bounding box or polygon with a hexagonal tiling of
+overlapping search circles, splits every circle that comes back saturated
+(60 results) into 7 circles of half the radius, runs the tiles concurrently
+and streams the places de-duplicated by place_id.
+
+Distances are computed on a local equirectangular projection around the
+area's centre, which is accurate enough for county/metro sized regions.
+"""
+from __future__ import absolute_import
+import concurrent.futures
+import itertools
+import math
+
+from . import lang
+from .GooglePlacesAPI import AGOL_JSON, GooglePlaces, _get_places_details
+
+
+METERS_PER_DEGREE = 111320.0
+MAX_RESULTS = 60
+
+
+def _normalize_area(area):
+    """Returns the area as a ring of (lng, lat) tuples.
+
+    area is either a bounding box (west, south, east, north) or a polygon given
+    as a sequence of (lng, lat) pairs or {'lat': .., 'lng': ..} dicts.
+    """
+    if len(area) == 4 and all(isinstance(c, (int, float)) for c in area):
+        west, south, east, north = area
+        if west >= east or south >= north:
+            raise ValueError('bbox must be given as (west, south, east, north).')
+        return [(west, south), (east, south), (east, north), (west, north)]
+    ring = []
+    for vertex in area:
+        if isinstance(vertex, dict):
+            ring.append((float(vertex['lng']), float(vertex['lat'])))
+        else:
+            ring.append((float(vertex[0]), float(vertex[1])))
+    if len(ring) > 1 and ring[0] == ring[-1]:
+        ring = ring[:-1]
+    if len(ring) < 3:
+        raise ValueError('A polygon needs at least 3 vertices.')
+    return ring
+
+def _point_in_polygon(x, y, ring):
+    inside = False
+    j = len(ring) - 1
+    for i in range(len(ring)):
+        xi, yi = ring[i]
+        xj, yj = ring[j]
+        if (yi > y) != (yj > y) and x < (xj - xi) * (y - yi) / (yj - yi) + xi:
+            inside = not inside
+        j = i
+    return inside
+
+def _distance_to_segment(x, y, x1, y1, x2, y2):
+    dx, dy = x2 - x1, y2 - y1
+    if dx == 0 and dy == 0:
+        return math.hypot(x - x1, y - y1)
+    t = max(0.0, min(1.0, ((x - x1) * dx + (y - y1) * dy) / (dx * dx + dy * dy)))
+    return math.hypot(x - (x1 + t * dx), y - (y1 + t * dy))
+
+def _circle_intersects_polygon(x, y, radius, ring):
+    if _point_in_polygon(x, y, ring):
+        return True
+    return any(_distance_to_segment(x, y, ring[i - 1][0], ring[i - 1][1],
+                                    ring[i][0], ring[i][1]) <= radius
+               for i in range(len(ring)))
+
+
+class _LocalProjection(object):
+    """Equirectangular projection in meters around a reference point."""
+
+    def __init__(self, ring):
+        self.lng0 = sum(v[0] for v in ring) / len(ring)
+        self.lat0 = sum(v[1] for v in ring) / len(ring)
+        self.x_scale = METERS_PER_DEGREE * math.cos(math.radians(self.lat0))
+
+    def forward(self, lng, lat):
+        return ((lng - self.lng0) * self.x_scale,
+                (lat - self.lat0) * METERS_PER_DEGREE)
+
+    def inverse(self, x, y):
+        return {'lat': self.lat0 + y / METERS_PER_DEGREE,
+                'lng': self.lng0 + x / self.x_scale}
+
+
+def hex_tiles(ring, radius):
+    """Returns the (x, y) centres of a hexagonal tiling of circles of the
+    given radius that covers the projected polygon ring."""
+    xs = [v[0] for v in ring]
+    ys = [v[1] for v in ring]
+    dx = math.sqrt(3) * radius
+    dy = 1.5 * radius
+    tiles = []
+    for row in range(int(math.ceil((max(ys) - min(ys) + 2 * radius) / dy)) + 1):
+        y = min(ys) - radius + row * dy
+        offset = dx / 2 if row % 2 else 0.0
+        for col in range(int(math.ceil((max(xs) - min(xs) + 2 * radius) / dx)) + 1):
+            x = min(xs) - radius + offset + col * dx
+            if _circle_intersects_polygon(x, y, radius, ring):
+                tiles.append((x, y))
+    return tiles
+
+def split_tile(x, y, radius):
+    """Returns 7 circles of half the radius that together cover the circle."""
+    child_radius = radius / 2.0
+    distance = math.sqrt(3) * child_radius
+    children = [(x, y, child_radius)]
+    for k in range(6):
+        angle = math.radians(60 * k + 30)
+        children.append((x + distance * math.cos(angle),
+                         y + distance * math.sin(angle), child_radius))
+    return children
+
+
+class AreaSearchResult(object):
+    """
+    Streaming, GooglePlacesSearchResult compatible result of
+    GooglePlaces.search_area.
+
+    The tiles are only searched while the places iterator (or iter_pages) is
+    consumed; coverage reports the tiling statistics gathered so far.
+    """
+
+    def __init__(self, query_instance, area, types=[], keyword=None, name=None,
+                 language=lang.ENGLISH, max_radius=GooglePlaces.MAXIMUM_SEARCH_RADIUS,
+                 min_radius=100, max_workers=8):
+        self._query_instance = query_instance
+        ring = _normalize_area(area)
+        self._projection = _LocalProjection(ring)
+        self._ring = [self._projection.forward(lng, lat) for lng, lat in ring]
+        self._search_kwargs = {'types': types, 'keyword': keyword,
+                               'name': name, 'language': language}
+        self._max_radius = min(max_radius, GooglePlaces.MAXIMUM_SEARCH_RADIUS)
+        self._min_radius = min_radius
+        self._max_workers = max_workers
+        self._seen = set()
+        self._html_attributions = []
+        self._errors = []
+        self._details_errors = {}
+        self._coverage = {'tiles_searched': 0,
+                          'tiles_split': 0,
+                          'tiles_saturated': 0,
+                          'tiles_failed': 0,
+                          'details_failed': 0,
+                          'results': 0,
+                          'duplicates': 0,
+                          'unique_places': 0,
+                          'max_depth': 0,
+                          'min_radius_used': self._max_radius}
+        self._pages = self.__search()
+        self._places_iterator = itertools.chain.from_iterable(self._pages)
+
+    def __search_tile(self, tile):
+        x, y, radius, depth = tile
+        google_places = GooglePlaces(self._query_instance.api_key,
+                                     session=self._query_instance.session,
+                                     details_cache=self._query_instance.details_cache,
+                                     page_token_poller=self._query_instance.page_token_poller,
+                                     rate_limiter=self._query_instance.rate_limiter,
+                                     geocode_cache=self._query_instance.geocode_cache)
+        return google_places.nearby_search(lat_lng=self._projection.inverse(x, y),
+                                           radius=int(math.ceil(radius)),
+                                           **self._search_kwargs)
+
+    def __search(self):
+        tiles = [(x, y, self._max_radius, 0)
+                 for x, y in hex_tiles(self._ring, self._max_radius)]
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=self._max_workers)
+        pending = {}
+        try:
+            pending.update((executor.submit(self.__search_tile, tile), tile) for tile in tiles)
+            while pending:
+                done, not_done = concurrent.futures.wait(
+                        pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    tile = pending.pop(future)
+                    new_places = self.__handle_tile(executor, pending, tile, future)
+                    if new_places:
+                        yield new_places
+        finally:
+            # tiles not started yet are dropped when the iterator is closed early
+            # (shutdown's cancel_futures needs Python 3.9)
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait=False)
+
+    def __handle_tile(self, executor, pending, tile, future):
+        x, y, radius, depth = tile
+        coverage = self._coverage
+        coverage['tiles_searched'] += 1
+        coverage['max_depth'] = max(coverage['max_depth'], depth)
+        coverage['min_radius_used'] = min(coverage['min_radius_used'], radius)
+        try:
+            result = future.result()
+        except Exception as e:
+            coverage['tiles_failed'] += 1
+            self._errors.append((self._projection.inverse(x, y), radius, e))
+            return []
+        for attribution in result.html_attributions:
+            if attribution not in self._html_attributions:
+                self._html_attributions.append(attribution)
+        if len(result.places) >= MAX_RESULTS:
+            if radius / 2.0 >= self._min_radius:
+                coverage['tiles_split'] += 1
+                for cx, cy, child_radius in split_tile(x, y, radius):
+                    if _circle_intersects_polygon(cx, cy, child_radius, self._ring):
+                        child = (cx, cy, child_radius, depth + 1)
+                        pending[executor.submit(self.__search_tile, child)] = child
+            else:
+                coverage['tiles_saturated'] += 1
+        new_places = []
+        for place in result.places:
+            coverage['results'] += 1
+            if place.place_id in self._seen:
+                coverage['duplicates'] += 1
+                continue
+            self._seen.add(place.place_id)
+            new_places.append(place)
+        coverage['unique_places'] += len(new_places)
+        return new_places
+
+    def iter_pages(self):
+        """Yields the new (not yet seen) places of each finished tile."""
+        return self._pages
+
+    @property
+    def places(self):
+        """A one-pass iterator over the de-duplicated places."""
+        return self._places_iterator
+
+    def place_table(self):
+        """Searches the remaining tiles into a columnar table.PlaceTable."""
+        from .table import PlaceTable
+        return PlaceTable.from_places(self._places_iterator, self._query_instance)
+
+    @property
+    def agol_json(self):
+        """
+        creates JSON file compatible with agol feature services
+
+        Places whose details request failed are left out; each one is added
+        to errors and counted in coverage['details_failed'].
+        """
+        places = list(self._places_iterator)
+        pending = [place for place in places if place._details is None]
+        details, errors = _get_places_details(
+                [place.place_id for place in pending], self._query_instance.api_key,
+                self._query_instance.sensor, language=self._search_kwargs['language'],
+                session=self._query_instance.session, max_workers=self._max_workers,
+                cache=self._query_instance.details_cache,
+                rate_limiter=self._query_instance.rate_limiter)
+        for place in pending:
+            place._details = details.get(place.place_id)
+            if place.place_id in errors:
+                self._coverage['details_failed'] += 1
+                self._details_errors[place.place_id] = errors[place.place_id]
+                self._errors.append((place.geo_location, None, errors[place.place_id]))
+        return AGOL_JSON([place for place in places if place._details is not None])
+
+    @property
+    def coverage(self):
+        """Returns a dict of tiling statistics: tiles searched, split, still
+        saturated at min_radius and failed, places left out of agol_json
+        because their details failed, raw results, duplicates, unique places,
+        deepest split level and smallest radius used."""
+        return dict(self._coverage)
+
+    @property
+    def errors(self):
+        """Returns a list of (lat_lng, radius, exception) for failed tiles and,
+        with radius None, for places whose details request failed."""
+        return self._errors
+
+    @property
+    def details_errors(self):
+        """dict of place_id -> exception for the places agol_json left out
+        because their details request failed."""
+        return self._details_errors
+
+    @property
+    def is_lazy(self):
+        return True
+
+    @property
+    def next_page_token(self):
+        return ''
+
+    @property
+    def has_next_page_token(self):
+        return False
+
+    @property
+    def html_attributions(self):
+        return self._html_attributions
+
+    @property
+    def has_attributions(self):
+        return len(self._html_attributions) > 0
+
+    def __repr__(self):
+        return '<{} with {} result(s) so far>'.format(self.__class__.__name__,
+                                                     self._coverage['unique_places'])
@@ -0,0 +1,229 @@
+"""
+Optional caches for Google Places API responses.
+
+A cache keeps an in-memory LRU tier in front of an optional on-disk (sqlite)
+tier. Every entry carries its own expiry time, and the cache counts hits and
+misses so the saving on repeat harvests can be measured.
+
+PlaceDetailsCache -- Place details keyed by (place_id, language); pass one to
+                     GooglePlaces(details_cache=...) to skip the details API
+                     for places fetched on an earlier run.
+GeocodeCache      -- Geocoded lat/lng keyed by the normalized address; pass one
+                     to GooglePlaces(geocode_cache=...) so repeated location=
+                     searches geocode each address once.
+"""
+from __future__ import absolute_import
+import collections
+import json
+import re
+import sqlite3
+import threading
+import time
+
+from HTTPTransport import JSONBackend
+
+
+def _encode_value(value):
+    return JSONBackend.dumps(value)
+
+def _decode_value(value):
+    return JSONBackend.loads(value)
+
+
+class TieredCache(object):
+    """In-memory LRU cache backed by an optional sqlite file.
+
+    Keys are tuples whose first element is the group the entry can be
+    invalidated by (e.g. the place_id). The cache is safe to share between
+    threads.
+    """
+
+    TABLE = 'entries'
+
+    def __init__(self, path=None, max_entries=10000, ttl=7 * 24 * 60 * 60,
+                 max_disk_entries=100000):
+        """
+        keyword arguments:
+        path             -- The sqlite file of the on-disk tier. The disk tier
+                            is disabled when None (default None).
+        max_entries      -- The number of entries kept in memory before the
+                            least recently used one is evicted (default 10000).
+        ttl              -- The default time to live of an entry in seconds
+                            (default one week).
+        max_disk_entries -- The number of rows kept on disk; beyond it expired
+                            rows and then the ones expiring first are deleted,
+                            down to 90% of it (default 100000, None for no
+                            limit).
+        """
+        self._max_entries = max_entries
+        self._max_disk_entries = max_disk_entries
+        self._disk_entries = 0
+        self._ttl = ttl
+        self._memory = collections.OrderedDict()
+        self._lock = threading.RLock()
+        self._hits = 0
+        self._disk_hits = 0
+        self._misses = 0
+        self._db = None
+        if path is not None:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute('CREATE TABLE IF NOT EXISTS %s (key TEXT PRIMARY KEY, '
+                             '"group" TEXT, expires REAL, value TEXT)' % self.TABLE)
+            self._db.execute('CREATE INDEX IF NOT EXISTS %s_group ON %s ("group")'
+                             % (self.TABLE, self.TABLE))
+            self._db.execute('CREATE INDEX IF NOT EXISTS %s_expires ON %s (expires)'
+                             % (self.TABLE, self.TABLE))
+            self._db.commit()
+            self.purge_expired()
+            self._evict_disk()
+
+    def get(self, key):
+        """Returns the cached value for key, or None on a miss."""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and entry[0] > now:
+                self._memory.move_to_end(key)
+                self._hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._memory[key]
+            if self._db is not None:
+                row = self._db.execute('SELECT expires, value FROM %s WHERE key = ?'
+                                       % self.TABLE, (json.dumps(key),)).fetchone()
+                if row is not None and row[0] > now:
+                    value = _decode_value(row[1])
+                    self._remember(key, row[0], value)
+                    self._hits += 1
+                    self._disk_hits += 1
+                    return value
+            self._misses += 1
+            return None
+
+    def set(self, key, value, ttl=None):
+        """Stores value under key for ttl seconds (default: the cache ttl)."""
+        expires = time.time() + (ttl if ttl is not None else self._ttl)
+        with self._lock:
+            self._remember(key, expires, value)
+            if self._db is not None:
+                self._db.execute('INSERT OR REPLACE INTO %s (key, "group", expires, value) '
+                                 'VALUES (?, ?, ?, ?)' % self.TABLE,
+                                 (json.dumps(key), key[0], expires, _encode_value(value)))
+                # counts replaced rows too, the exact count is taken once it passes the limit
+                self._disk_entries += 1
+                if self._max_disk_entries is not None and self._disk_entries > self._max_disk_entries:
+                    self._evict_disk()
+                self._db.commit()
+
+    def invalidate(self, group):
+        """Removes every entry whose key starts with group."""
+        with self._lock:
+            for key in [key for key in self._memory if key[0] == group]:
+                del self._memory[key]
+            if self._db is not None:
+                self._db.execute('DELETE FROM %s WHERE "group" = ?' % self.TABLE, (group,))
+                self._db.commit()
+
+    def purge_expired(self):
+        """Drops expired entries from both tiers."""
+        now = time.time()
+        with self._lock:
+            for key in [key for key, entry in self._memory.items() if entry[0] <= now]:
+                del self._memory[key]
+            if self._db is not None:
+                self._db.execute('DELETE FROM %s WHERE expires <= ?' % self.TABLE, (now,))
+                self._db.commit()
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            if self._db is not None:
+                self._db.execute('DELETE FROM %s' % self.TABLE)
+                self._db.commit()
+                self._disk_entries = 0
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def _disk_count(self):
+        return self._db.execute('SELECT COUNT(*) FROM %s' % self.TABLE).fetchone()[0]
+
+    def _evict_disk(self):
+        # callers hold _lock (or are __init__) and commit
+        self._disk_entries = self._disk_count()
+        if self._max_disk_entries is None or self._disk_entries <= self._max_disk_entries:
+            return
+        self._db.execute('DELETE FROM %s WHERE expires <= ?' % self.TABLE, (time.time(),))
+        # down to 90% of the limit, so the eviction does not run again on every insert
+        excess = self._disk_count() - (self._max_disk_entries - self._max_disk_entries // 10)
+        if excess > 0:
+            self._db.execute('DELETE FROM %s WHERE key IN (SELECT key FROM %s ORDER BY expires LIMIT ?)'
+                             % (self.TABLE, self.TABLE), (excess,))
+        self._disk_entries = self._disk_count()
+
+    def _remember(self, key, expires, value):
+        self._memory[key] = (expires, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self._max_entries:
+            self._memory.popitem(last=False)
+
+    @property
+    def hits(self):
+        return self._hits
+
+    @property
+    def misses(self):
+        return self._misses
+
+    @property
+    def stats(self):
+        """Returns a dict of the hit/miss counters and the in-memory size."""
+        with self._lock:
+            return {'hits': self._hits,
+                    'memory_hits': self._hits - self._disk_hits,
+                    'disk_hits': self._disk_hits,
+                    'misses': self._misses,
+                    'memory_entries': len(self._memory)}
+
+    def __len__(self):
+        return len(self._memory)
+
+
+class PlaceDetailsCache(TieredCache):
+    """Cache of Place details responses keyed by (place_id, language)."""
+
+    TABLE = 'place_details'
+
+    def get_details(self, place_id, language):
+        return self.get((place_id, language))
+
+    def set_details(self, place_id, language, details, ttl=None):
+        self.set((place_id, language), details, ttl=ttl)
+
+
+def normalize_address(location):
+    """Returns the cache key form of an address: case folded, with runs of
+    whitespace collapsed and spaces around commas removed, so 'London,England'
+    and ' london ,  england' share an entry."""
+    location = re.sub(r'\s+', ' ', location.strip().casefold())
+    return re.sub(r'\s*,\s*', ',', location)
+
+
+class GeocodeCache(TieredCache):
+    """Cache of geocoded {'lat': .., 'lng': ..} dicts keyed by the normalized
+    address. Addresses rarely move, so entries live for 30 days by default."""
+
+    TABLE = 'geocode'
+
+    def __init__(self, path=None, max_entries=10000, ttl=30 * 24 * 60 * 60,
+                 max_disk_entries=100000):
+        super(GeocodeCache, self).__init__(path, max_entries, ttl, max_disk_entries)
+
+    def get_location(self, location):
+        return self.get((normalize_address(location),))
+
+    def set_location(self, location, lat_lng, ttl=None):
+        self.set((normalize_address(location),), lat_lng, ttl=ttl)
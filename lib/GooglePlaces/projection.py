@@ -0,0 +1,57 @@
+"""
+Batch coordinate conversion for AGOL_JSON.
+
+Coordinates are converted (and optionally reprojected from WGS84 to Web
+Mercator) a whole batch at a time. With NumPy installed each batch is one
+vectorized cast/projection; without it the same math runs in a plain loop.
+"""
+from __future__ import absolute_import
+import math
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+WGS84 = 4326
+WEB_MERCATOR = 3857
+
+EARTH_RADIUS = 6378137.0
+MAX_MERCATOR_LATITUDE = 85.0511287798
+
+SPATIAL_REFERENCES = {WGS84: {'wkid': 4326},
+                      WEB_MERCATOR: {'wkid': 102100, 'latestWkid': 3857}}
+GEOJSON_CRS_NAMES = {WGS84: 'EPSG:4326',
+                     WEB_MERCATOR: 'EPSG:3857'}
+
+
+def validate_wkid(wkid):
+    """Maps the ESRI alias 102100 to 3857 and rejects unsupported wkids."""
+    wkid = WEB_MERCATOR if wkid == 102100 else wkid
+    if wkid not in SPATIAL_REFERENCES:
+        raise ValueError('out_sr must be %s (WGS84) or %s (Web Mercator).' %
+                         (WGS84, WEB_MERCATOR))
+    return wkid
+
+def project(lngs, lats, wkid=WGS84):
+    """Returns a tuple (xs, ys) of float lists for sequences of WGS84
+    longitudes and latitudes (floats, Decimals or numeric strings), projected
+    to wkid."""
+    wkid = validate_wkid(wkid)
+    if numpy is not None:
+        xs = numpy.asarray(lngs, dtype=numpy.float64)
+        ys = numpy.asarray(lats, dtype=numpy.float64)
+        if wkid == WEB_MERCATOR:
+            ys = numpy.clip(ys, -MAX_MERCATOR_LATITUDE, MAX_MERCATOR_LATITUDE)
+            xs = numpy.radians(xs) * EARTH_RADIUS
+            ys = numpy.log(numpy.tan(numpy.pi / 4 + numpy.radians(ys) / 2)) * EARTH_RADIUS
+        return xs.tolist(), ys.tolist()
+    xs = [float(lng) for lng in lngs]
+    ys = [float(lat) for lat in lats]
+    if wkid == WEB_MERCATOR:
+        xs = [math.radians(x) * EARTH_RADIUS for x in xs]
+        ys = [math.log(math.tan(math.pi / 4 + math.radians(
+                max(-MAX_MERCATOR_LATITUDE, min(MAX_MERCATOR_LATITUDE, y))) / 2)) * EARTH_RADIUS
+              for y in ys]
+    return xs, ys
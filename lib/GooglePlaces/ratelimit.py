@@ -0,0 +1,169 @@
+"""
+Client-side rate limiting for Google Places API calls.
+
+RateLimiter keeps a token bucket per endpoint (nearby, text, details, photo,
+autocomplete, ...) and an optional daily request budget. When Google answers
+OVER_QUERY_LIMIT the endpoint's rate is halved and requests to it pause for a
+growing cooldown; every successful call then creeps the rate back up to the
+configured QPS. One RateLimiter can be shared by all the GooglePlaces (and
+AsyncGooglePlaces) instances of a process so concurrent harvesters stay just
+under the quota.
+
+Waiting is left to the caller: reserve() returns the number of seconds to
+sleep, so the same limiter serves threads (time.sleep) and event loops
+(asyncio.sleep).
+"""
+from __future__ import absolute_import
+import datetime
+import threading
+import time
+
+
+NEARBY = 'nearby'
+TEXT = 'text'
+RADAR = 'radar'
+DETAILS = 'details'
+PHOTO = 'photo'
+AUTOCOMPLETE = 'autocomplete'
+GEOCODE = 'geocode'
+OTHER = 'other'
+
+DEFAULT_QPS = {NEARBY: 10, TEXT: 10, RADAR: 10, DETAILS: 10, PHOTO: 10,
+               AUTOCOMPLETE: 10, GEOCODE: 10, OTHER: 10}
+
+
+class TokenBucket(object):
+    """A thread-safe token bucket refilled at rate tokens per second."""
+
+    def __init__(self, rate, capacity=None):
+        self._rate = float(rate)
+        self._capacity = float(capacity if capacity is not None else max(1, rate))
+        self._tokens = self._capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """Takes a token and returns the seconds to wait before using it."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self._capacity,
+                               self._tokens + (now - self._updated) * self._rate)
+            self._updated = now
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self._rate
+
+    @property
+    def rate(self):
+        return self._rate
+
+    @rate.setter
+    def rate(self, rate):
+        with self._lock:
+            self._rate = float(rate)
+
+
+class RateLimiter(object):
+    """Per-endpoint QPS limits, a daily quota budget and adaptive backoff.
+
+    keyword arguments:
+    qps          -- A dict of endpoint -> queries per second, merged over
+                    DEFAULT_QPS (default None).
+    daily_quota  -- The maximum number of requests per UTC day, or None for no
+                    budget (default None).
+    min_qps      -- The lowest rate OVER_QUERY_LIMIT backoff may reduce an
+                    endpoint to (default 0.5).
+    cooldown     -- The pause after a first OVER_QUERY_LIMIT in seconds; it
+                    doubles with every consecutive one (default 1.0).
+    max_cooldown -- The upper bound of the pause (default 60.0).
+    max_retries  -- How many times a request answered with OVER_QUERY_LIMIT is
+                    retried before the error is raised (default 5).
+    """
+
+    def __init__(self, qps=None, daily_quota=None, min_qps=0.5, cooldown=1.0,
+                 max_cooldown=60.0, max_retries=5):
+        self._qps = dict(DEFAULT_QPS)
+        if qps: self._qps.update(qps)
+        self._buckets = dict((endpoint, TokenBucket(rate))
+                             for endpoint, rate in self._qps.items())
+        self._daily_quota = daily_quota
+        self._min_qps = min_qps
+        self._cooldown = cooldown
+        self._max_cooldown = max_cooldown
+        self.max_retries = max_retries
+        self._paused_until = {}
+        self._strikes = {}
+        self._day = None
+        self._used_today = 0
+        self._over_query_limit_count = 0
+        self._lock = threading.Lock()
+
+    def reserve(self, endpoint):
+        """Books one request to endpoint.
+
+        Returns the seconds to wait before sending it, or None when the daily
+        quota budget is exhausted.
+        """
+        bucket = self.__bucket(endpoint)
+        with self._lock:
+            today = datetime.datetime.now(datetime.timezone.utc).date()
+            if today != self._day:
+                self._day = today
+                self._used_today = 0
+            if self._daily_quota is not None and self._used_today >= self._daily_quota:
+                return None
+            self._used_today += 1
+            pause = max(0.0, self._paused_until.get(endpoint, 0.0) - time.monotonic())
+        return max(pause, bucket.reserve())
+
+    def over_query_limit(self, endpoint):
+        """Records an OVER_QUERY_LIMIT answer: halves the endpoint's rate and
+        pauses it for an exponentially growing cooldown."""
+        bucket = self.__bucket(endpoint)
+        with self._lock:
+            self._over_query_limit_count += 1
+            strikes = self._strikes.get(endpoint, 0) + 1
+            self._strikes[endpoint] = strikes
+            cooldown = min(self._max_cooldown, self._cooldown * 2 ** (strikes - 1))
+            self._paused_until[endpoint] = time.monotonic() + cooldown
+            bucket.rate = max(self._min_qps, bucket.rate / 2.0)
+
+    def success(self, endpoint):
+        """Records a successful answer: the rate recovers additively."""
+        bucket = self.__bucket(endpoint)
+        with self._lock:
+            self._strikes[endpoint] = 0
+            target = self._qps.get(endpoint, self._qps[OTHER])
+            if bucket.rate < target:
+                bucket.rate = min(target, bucket.rate + target / 10.0)
+
+    def __bucket(self, endpoint):
+        bucket = self._buckets.get(endpoint)
+        if bucket is None:
+            with self._lock:
+                bucket = self._buckets.setdefault(endpoint,
+                                                  TokenBucket(self._qps[OTHER]))
+        return bucket
+
+    def rate(self, endpoint):
+        """Returns the current (possibly backed off) rate of endpoint."""
+        return self.__bucket(endpoint).rate
+
+    @property
+    def daily_quota(self):
+        return self._daily_quota
+
+    @property
+    def used_today(self):
+        return self._used_today
+
+    @property
+    def remaining_today(self):
+        if self._daily_quota is None:
+            return None
+        return max(0, self._daily_quota - self._used_today)
+
+    @property
+    def over_query_limit_count(self):
+        return self._over_query_limit_count
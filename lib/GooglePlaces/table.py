@@ -0,0 +1,158 @@
+"""
+Columnar storage for large Google Places result sets.
+
+A PlaceTable keeps the search-level fields of many places in parallel columns
+instead of one Place object (and one place_data dict) per result:
+coordinates and ratings in typed arrays, names and vicinities in plain lists
+and the types of each place as an index into a table of distinct, interned
+type tuples. Place objects are only built when a row is accessed.
+"""
+from __future__ import absolute_import
+from array import array
+import math
+import sys
+
+from .GooglePlacesAPI import Place
+
+
+_OPEN_NOW = {None: -1, False: 0, True: 1}
+_OPEN_NOW_VALUES = {0: False, 1: True}
+
+
+class PlaceTable(object):
+    """Parallel-array container of places; rows convert lazily to Place."""
+
+    def __init__(self, query_instance=None):
+        """
+        keyword arguments:
+        query_instance -- The GooglePlaces instance the Place objects built
+                          from this table use for get_details() etc.
+        """
+        self._query_instance = query_instance
+        self._place_ids = []
+        self._names = []
+        self._vicinities = []
+        self._lats = array('d')
+        self._lngs = array('d')
+        self._ratings = array('d')
+        self._open_now = array('b')
+        self._type_ids = array('I')
+        self._type_sets = []
+        self._type_set_ids = {}
+        self._index = {}
+        self._indexed_rows = 0
+
+    @classmethod
+    def from_places(cls, places, query_instance=None):
+        """Builds a table from an iterable of Place objects or place dicts."""
+        table = cls(query_instance)
+        table.extend(places)
+        return table
+
+    def append(self, place):
+        """Adds a Place, or a place dict as returned by the Places API."""
+        place_data = place.place_data if isinstance(place, Place) else place
+        location = place_data['geometry']['location']
+        rating = place_data.get('rating')
+        self._place_ids.append(place_data['place_id'])
+        self._names.append(place_data.get('name'))
+        self._vicinities.append(place_data.get('vicinity'))
+        self._lats.append(float(location['lat']))
+        self._lngs.append(float(location['lng']))
+        self._ratings.append(float('nan') if rating is None else float(rating))
+        self._open_now.append(_OPEN_NOW.get(
+                place_data.get('opening_hours', {}).get('open_now'), -1))
+        self._type_ids.append(self.__type_set_id(place_data.get('types')))
+
+    def extend(self, places):
+        for place in places:
+            self.append(place)
+
+    def __type_set_id(self, types):
+        types = tuple(sys.intern(str(type)) for type in types or ())
+        type_set_id = self._type_set_ids.get(types)
+        if type_set_id is None:
+            type_set_id = self._type_set_ids[types] = len(self._type_sets)
+            self._type_sets.append(types)
+        return type_set_id
+
+    def place_data(self, i):
+        """Returns the search-level place dict of row i."""
+        place_data = {'place_id': self._place_ids[i],
+                      'geometry': {'location': {'lat': self._lats[i],
+                                                'lng': self._lngs[i]}}}
+        if self._names[i] is not None:
+            place_data['name'] = self._names[i]
+        if self._vicinities[i] is not None:
+            place_data['vicinity'] = self._vicinities[i]
+        if not math.isnan(self._ratings[i]):
+            place_data['rating'] = self._ratings[i]
+        if self._type_sets[self._type_ids[i]]:
+            place_data['types'] = list(self._type_sets[self._type_ids[i]])
+        if self._open_now[i] in _OPEN_NOW_VALUES:
+            place_data['opening_hours'] = {'open_now': _OPEN_NOW_VALUES[self._open_now[i]]}
+        return place_data
+
+    def __row(self, place_id):
+        # the place_id index is only built (and extended) once a lookup needs it
+        for i in range(self._indexed_rows, len(self._place_ids)):
+            self._index.setdefault(self._place_ids[i], i)
+        self._indexed_rows = len(self._place_ids)
+        return self._index.get(place_id)
+
+    def get(self, place_id):
+        """Returns the Place with the given place_id, or None."""
+        i = self.__row(place_id)
+        return None if i is None else self[i]
+
+    def types(self, i):
+        """Returns the (interned) types of row i as a tuple."""
+        return self._type_sets[self._type_ids[i]]
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        return Place(self._query_instance, self.place_data(i))
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def __len__(self):
+        return len(self._place_ids)
+
+    def __contains__(self, place_id):
+        return self.__row(place_id) is not None
+
+    @property
+    def place_ids(self):
+        return self._place_ids
+
+    @property
+    def names(self):
+        return self._names
+
+    @property
+    def lats(self):
+        """array('d') of latitudes."""
+        return self._lats
+
+    @property
+    def lngs(self):
+        """array('d') of longitudes."""
+        return self._lngs
+
+    @property
+    def ratings(self):
+        """array('d') of ratings, NaN where a place has no rating."""
+        return self._ratings
+
+    @property
+    def type_sets(self):
+        """The distinct type tuples the rows index into."""
+        return self._type_sets
+
+    def __repr__(self):
+        return '<{} with {} place(s)>'.format(self.__class__.__name__, len(self))
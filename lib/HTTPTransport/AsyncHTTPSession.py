@@ -0,0 +1,205 @@
+"""
+COPYRIGHT 2016 ESRI
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>
+"""
+__author__='joelwhitney'
+"""
+  Requires Python 3.5+
+  The asyncio counterpart of HTTPSession.py.
+
+  The AsyncHTTPSession.py helper class speaks HTTP/1.1 over asyncio streams,
+  keeps idle keep-alive connections per host and caps the number of requests
+  in flight with a semaphore, so a single event loop can drive hundreds of
+  GooglePlaces/AGOL requests at once.
+"""
+import asyncio
+import email.parser
+import http.client
+import ssl
+import urllib
+import urllib.error
+import urllib.parse
+from HTTPTransport.HTTPSession import HTTPResponse, HTTPSession, decode_content
+
+
+class AsyncHTTPSession(object):
+    """
+    Asyncio keep-alive HTTP transport:
+      -Limits concurrent requests to max_concurrency
+      -Reuses connections per host (pool_size idle connections each)
+      -Decodes gzip/deflate, follows redirects, raises urllib.error.HTTPError
+    """
+    REDIRECT_CODES = HTTPSession.REDIRECT_CODES
+
+    def __init__(self, max_concurrency=100, pool_size=20, timeout=60, max_redirects=5, headers=None):
+        self._max_concurrency = max_concurrency
+        self._pool_size = pool_size
+        self._timeout = timeout
+        self._max_redirects = max_redirects
+        self._headers = {'Accept-Encoding': 'gzip, deflate',
+                         'Connection': 'keep-alive',
+                         'User-Agent': 'python-libraries/AsyncHTTPSession'}
+        if headers: self._headers.update(headers)
+        self._idle = {}
+        self._semaphore = None
+        self._ssl_context = ssl.create_default_context()
+
+    async def urlopen(self, url, data=None, headers=None):
+        """
+        Coroutine version of HTTPSession.urlopen; returns a fully read
+        HTTPResponse. POSTs when data is given, otherwise GETs.
+        """
+        if self._semaphore is None:
+            # created lazily so it binds to the running event loop
+            self._semaphore = asyncio.Semaphore(self._max_concurrency)
+        method = 'GET'
+        request_headers = dict(self._headers)
+        if headers: request_headers.update(headers)
+        if data is not None:
+            method = 'POST'
+            if isinstance(data, dict):
+                data = urllib.parse.urlencode(data)
+            if isinstance(data, str):
+                data = data.encode('utf-8')
+            request_headers.setdefault('Content-Type', 'application/x-www-form-urlencoded')
+        async with self._semaphore:
+            for redirect in range(self._max_redirects + 1):
+                status, reason, response_headers, body = await asyncio.wait_for(
+                    self.__send(method, url, data, request_headers), self._timeout)
+                if status in self.REDIRECT_CODES and response_headers.get('Location'):
+                    url = urllib.parse.urljoin(url, response_headers.get('Location'))
+                    if status in (301, 302, 303):
+                        method, data = 'GET', None
+                        request_headers.pop('Content-Type', None)
+                    continue
+                body = decode_content(body, response_headers.get('Content-Encoding', ''))
+                if status >= 400:
+                    raise urllib.error.HTTPError(url, status, reason, response_headers, None)
+                return HTTPResponse(url, status, reason, response_headers, body)
+        raise urllib.error.HTTPError(url, status, 'Too many redirects', response_headers, None)
+
+    async def close(self):
+        """Closes every idle connection held by the session."""
+        idle, self._idle = self._idle, {}
+        for connections in idle.values():
+            for reader, writer in connections:
+                writer.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+    async def __get_connection(self, scheme, host, port):
+        connections = self._idle.get((scheme, host, port), [])
+        while connections:
+            reader, writer = connections.pop()
+            if not writer.is_closing() and not reader.at_eof():
+                return reader, writer, True
+            writer.close()
+        reader, writer = await asyncio.open_connection(
+            host, port, ssl=self._ssl_context if scheme == 'https' else None)
+        return reader, writer, False
+
+    def __put_connection(self, key, reader, writer):
+        connections = self._idle.setdefault(key, [])
+        if len(connections) < self._pool_size:
+            connections.append((reader, writer))
+        else:
+            writer.close()
+
+    async def __send(self, method, url, data, headers):
+        split_url = urllib.parse.urlsplit(url)
+        if split_url.scheme not in ('http', 'https'):
+            raise ValueError('Unsupported URL scheme: {}'.format(url))
+        scheme, host = split_url.scheme, split_url.hostname
+        port = split_url.port or (443 if scheme == 'https' else 80)
+        path = split_url.path or '/'
+        if split_url.query: path += '?' + split_url.query
+        request = ['{} {} HTTP/1.1'.format(method, path), 'Host: {}'.format(split_url.netloc)]
+        request += ['{}: {}'.format(k, v) for k, v in headers.items()]
+        request.append('Content-Length: {}'.format(len(data) if data is not None else 0))
+        request = ('\r\n'.join(request) + '\r\n\r\n').encode('latin-1') + (data or b'')
+
+        reader, writer, reused = await self.__get_connection(scheme, host, port)
+        try:
+            writer.write(request)
+            await writer.drain()
+            status_line = await reader.readline()
+            if not status_line and reused and method in HTTPSession.IDEMPOTENT_METHODS:
+                # server dropped an idle keep-alive connection, retry once on a fresh one; a POST may already
+                # have been processed and is not resent
+                writer.close()
+                reader, writer, reused = await self.__get_connection(scheme, host, port)
+                writer.write(request)
+                await writer.drain()
+                status_line = await reader.readline()
+            if not status_line:
+                raise http.client.RemoteDisconnected('Remote end closed connection without response')
+            version, status, reason = self.__parse_status_line(status_line)
+            response_headers = await self.__read_headers(reader)
+            body, keep_alive = await self.__read_body(reader, method, status, version, response_headers)
+        except BaseException:
+            writer.close()
+            raise
+        if keep_alive:
+            self.__put_connection((scheme, host, port), reader, writer)
+        else:
+            writer.close()
+        return status, reason, response_headers, body
+
+    def __parse_status_line(self, status_line):
+        parts = status_line.decode('latin-1').rstrip('\r\n').split(' ', 2)
+        if len(parts) < 2 or not parts[0].startswith('HTTP/'):
+            raise http.client.BadStatusLine(status_line)
+        return parts[0], int(parts[1]), parts[2] if len(parts) > 2 else ''
+
+    async def __read_headers(self, reader):
+        lines = []
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            lines.append(line.decode('latin-1'))
+        return email.parser.Parser(_class=http.client.HTTPMessage).parsestr(''.join(lines))
+
+    async def __read_body(self, reader, method, status, version, response_headers):
+        connection = (response_headers.get('Connection') or '').lower()
+        keep_alive = connection != 'close' and not (version == 'HTTP/1.0' and connection != 'keep-alive')
+        if method == 'HEAD' or status in (204, 304) or 100 <= status < 200:
+            return b'', keep_alive
+        if 'chunked' in (response_headers.get('Transfer-Encoding') or '').lower():
+            chunks = []
+            while True:
+                size = int((await reader.readline()).split(b';')[0].strip(), 16)
+                if size == 0:
+                    break
+                chunks.append(await reader.readexactly(size))
+                await reader.readline()
+            while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                pass  # trailers
+            return b''.join(chunks), keep_alive
+        if response_headers.get('Content-Length') is not None:
+            return await reader.readexactly(int(response_headers.get('Content-Length'))), keep_alive
+        return await reader.read(), False
+
+    @property
+    def max_concurrency(self):
+        return self._max_concurrency
+
+    @property
+    def pool_size(self):
+        return self._pool_size
@@ -0,0 +1,276 @@
+"""
+COPYRIGHT 2016 ESRI
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>
+"""
+__author__='joelwhitney'
+"""
+  Requires Python 3+
+  A pooled keep-alive HTTP transport shared by the GooglePlaces and ArcRESTAPI
+  wrappers.
+
+  The HTTPSession.py helper class keeps a small pool of open connections per
+  host so repeated calls skip the TCP/TLS handshake, and transparently decodes
+  gzip/deflate response bodies. A single HTTPSession can be handed to both a
+  GooglePlaces instance and an AGOLHandler.
+"""
+import collections
+import http.client
+import select
+import threading
+import urllib
+import urllib.error
+import urllib.parse
+import zlib
+
+
+def decode_content(body, content_encoding):
+    """Decodes a gzip/deflate encoded response body."""
+    content_encoding = (content_encoding or '').lower()
+    if content_encoding in ('gzip', 'x-gzip'):
+        return zlib.decompress(body, 16 + zlib.MAX_WBITS)
+    if content_encoding == 'deflate':
+        try:
+            return zlib.decompress(body)
+        except zlib.error:
+            return zlib.decompress(body, -zlib.MAX_WBITS)
+    return body
+
+
+class HTTPResponse(object):
+    """
+    Fully read response returned by HTTPSession.urlopen. Mirrors the parts of
+    the urllib response object the wrappers use (read, geturl, headers).
+    """
+    def __init__(self, url, status, reason, headers, body):
+        self._url = url
+        self._status = status
+        self._reason = reason
+        self._headers = headers
+        self._body = body
+
+    def read(self):
+        return self._body
+
+    def geturl(self):
+        return self._url
+
+    def getcode(self):
+        return self._status
+
+    @property
+    def status(self):
+        return self._status
+
+    @property
+    def reason(self):
+        return self._reason
+
+    @property
+    def headers(self):
+        return self._headers
+
+
+def connection_dropped(connection):
+    """True when the server has closed an idle connection (its socket is readable: EOF or a stray byte)"""
+    if connection.sock is None:
+        return False
+    try:
+        return bool(select.select([connection.sock], [], [], 0)[0])
+    except (OSError, ValueError):
+        return True
+
+
+class HTTPConnectionPool(object):
+    """
+    Idle keep-alive connections to a single (scheme, host, port).
+
+    At most pool_size idle connections are kept; requests beyond that open a
+    throwaway connection instead of blocking.
+    """
+    def __init__(self, scheme, host, port, pool_size=10, timeout=60):
+        self._scheme = scheme
+        self._host = host
+        self._port = port
+        self._pool_size = pool_size
+        self._timeout = timeout
+        self._idle = collections.deque()
+        self._lock = threading.Lock()
+
+    def get_connection(self):
+        """Returns (connection, reused) with an idle connection preferred; ones the server closed are dropped."""
+        with self._lock:
+            while self._idle:
+                connection = self._idle.pop()
+                if not connection_dropped(connection):
+                    return connection, True
+                connection.close()
+        return self.new_connection(), False
+
+    def new_connection(self):
+        if self._scheme == 'https':
+            return http.client.HTTPSConnection(self._host, self._port, timeout=self._timeout)
+        return http.client.HTTPConnection(self._host, self._port, timeout=self._timeout)
+
+    def put_connection(self, connection):
+        with self._lock:
+            if len(self._idle) < self._pool_size:
+                self._idle.append(connection)
+                return
+        connection.close()
+
+    def close(self):
+        with self._lock:
+            while self._idle:
+                self._idle.pop().close()
+
+
+class HTTPSession(object):
+    """
+    Pooled keep-alive HTTP transport:
+      -Reuses connections per host (pool_size idle connections each)
+      -Requests and decodes gzip/deflate responses
+      -Follows redirects like urllib.request.urlopen
+      -Raises urllib.error.HTTPError for 4xx/5xx responses
+    """
+    REDIRECT_CODES = (301, 302, 303, 307, 308)
+    IDEMPOTENT_METHODS = ('GET', 'HEAD', 'PUT', 'DELETE', 'OPTIONS')
+    STALE_CONNECTION_ERRORS = (http.client.RemoteDisconnected, http.client.BadStatusLine,
+                               ConnectionResetError, BrokenPipeError)
+
+    def __init__(self, pool_size=10, timeout=60, max_redirects=5, headers=None):
+        self._pool_size = pool_size
+        self._timeout = timeout
+        self._max_redirects = max_redirects
+        self._headers = {'Accept-Encoding': 'gzip, deflate',
+                         'Connection': 'keep-alive',
+                         'User-Agent': 'python-libraries/HTTPSession'}
+        if headers: self._headers.update(headers)
+        self._pools = {}
+        self._lock = threading.Lock()
+
+    def urlopen(self, url, data=None, headers=None):
+        """
+        Drop-in replacement for urllib.request.urlopen(url, data). Sends a POST
+        when data is given (bytes, str or a dict to urlencode), otherwise a GET.
+        """
+        method = 'GET'
+        request_headers = dict(self._headers)
+        if headers: request_headers.update(headers)
+        if data is not None:
+            method = 'POST'
+            if isinstance(data, dict):
+                data = urllib.parse.urlencode(data)
+            if isinstance(data, str):
+                data = data.encode('utf-8')
+            request_headers.setdefault('Content-Type', 'application/x-www-form-urlencoded')
+        for redirect in range(self._max_redirects + 1):
+            status, reason, response_headers, body = self.__send(method, url, data, request_headers)
+            if status in self.REDIRECT_CODES and response_headers.get('Location'):
+                url = urllib.parse.urljoin(url, response_headers.get('Location'))
+                if status in (301, 302, 303):
+                    method, data = 'GET', None
+                    request_headers.pop('Content-Type', None)
+                continue
+            body = decode_content(body, response_headers.get('Content-Encoding', ''))
+            if status >= 400:
+                raise urllib.error.HTTPError(url, status, reason, response_headers, None)
+            return HTTPResponse(url, status, reason, response_headers, body)
+        raise urllib.error.HTTPError(url, status, 'Too many redirects', response_headers, None)
+
+    def close(self):
+        """Closes every idle connection held by the session."""
+        with self._lock:
+            pools = list(self._pools.values())
+            self._pools = {}
+        for pool in pools:
+            pool.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __pool(self, scheme, host, port):
+        key = (scheme, host, port)
+        with self._lock:
+            if key not in self._pools:
+                self._pools[key] = HTTPConnectionPool(scheme, host, port, self._pool_size, self._timeout)
+            return self._pools[key]
+
+    def __send(self, method, url, data, headers):
+        split_url = urllib.parse.urlsplit(url)
+        if split_url.scheme not in ('http', 'https'):
+            raise ValueError('Unsupported URL scheme: {}'.format(url))
+        path = split_url.path or '/'
+        if split_url.query: path += '?' + split_url.query
+        pool = self.__pool(split_url.scheme, split_url.hostname, split_url.port)
+        connection, reused = pool.get_connection()
+        sent = False
+        try:
+            connection.request(method, path, body=data, headers=headers)
+            sent = True
+            response = connection.getresponse()
+        except self.STALE_CONNECTION_ERRORS:
+            # server dropped an idle keep-alive connection, retry once on a fresh one; a POST that was written
+            # out may already have been processed, so it is only resent if writing it failed
+            connection.close()
+            if not reused or (sent and method not in self.IDEMPOTENT_METHODS): raise
+            connection = pool.new_connection()
+            try:
+                connection.request(method, path, body=data, headers=headers)
+                response = connection.getresponse()
+            except Exception:
+                connection.close()
+                raise
+        except Exception:
+            connection.close()
+            raise
+        try:
+            body = response.read()
+        except Exception:
+            connection.close()
+            raise
+        if response.will_close:
+            connection.close()
+        else:
+            pool.put_connection(connection)
+        return response.status, response.reason, response.headers, body
+
+    @property
+    def pool_size(self):
+        return self._pool_size
+
+    @property
+    def timeout(self):
+        return self._timeout
+
+
+_default_session = None
+_default_session_lock = threading.Lock()
+
+def default_session():
+    """Returns the process-wide HTTPSession used when none is passed in."""
+    global _default_session
+    with _default_session_lock:
+        if _default_session is None:
+            _default_session = HTTPSession()
+        return _default_session
+
+def set_default_session(session):
+    """Replaces the process-wide HTTPSession (e.g. to change pool_size)."""
+    global _default_session
+    with _default_session_lock:
+        _default_session = session
@@ -0,0 +1,100 @@
+"""
+  Requires Python 3+
+  Selectable JSON backend shared by the GooglePlaces and ArcRESTAPI wrappers.
+
+  loads/dumps/dump go through orjson or ujson when one is installed and fall
+  back to the standard library json module otherwise. Floats are parsed as
+  float; Decimal parsing is opt-in (set_backend(use_decimal=True) or
+  loads(..., use_decimal=True)) and always uses the standard library, the
+  only backend that supports it.
+"""
+from decimal import Decimal
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+
+BACKENDS = ('orjson', 'ujson', 'json')
+
+_backend = None
+_use_decimal = False
+
+
+def available_backends():
+    """Returns the names of the backends that can be used here, fastest first."""
+    installed = {'orjson': orjson, 'ujson': ujson, 'json': json}
+    return [name for name in BACKENDS if installed[name] is not None]
+
+def set_backend(name=None, use_decimal=False):
+    """
+    Selects the JSON backend used by loads/dumps/dump.
+
+    keyword arguments:
+    name        -- 'orjson', 'ujson' or 'json'; None picks the fastest installed
+                   backend (default None).
+    use_decimal -- Parse JSON floats as decimal.Decimal by default (default False).
+    """
+    global _backend, _use_decimal
+    if name is None:
+        name = available_backends()[0]
+    if name not in available_backends():
+        raise ValueError('JSON backend {} is not installed, choose one of {}'.format(name, available_backends()))
+    _backend = name
+    _use_decimal = use_decimal
+
+def get_backend():
+    if _backend is None:
+        set_backend()
+    return _backend
+
+def use_decimal():
+    return _use_decimal
+
+def _default(obj):
+    if isinstance(obj, Decimal):
+        return float(obj)
+    return str(obj)
+
+def loads(data, use_decimal=None):
+    """Parses a JSON document given as str or bytes."""
+    if use_decimal is None:
+        use_decimal = _use_decimal
+    backend = get_backend()
+    if use_decimal:
+        return json.loads(data, parse_float=Decimal)
+    if backend == 'orjson':
+        return orjson.loads(data)
+    if backend == 'ujson':
+        return ujson.loads(data)
+    return json.loads(data)
+
+def dumps(obj, indent=None, sort_keys=False):
+    """
+    Encodes obj as a JSON str. indent=None gives the compact form (no newlines,
+    no padding), which is what request bodies and large exports should use.
+    Decimal values are written as numbers.
+    """
+    backend = get_backend()
+    if backend == 'orjson' and indent in (None, 2):
+        option = orjson.OPT_NON_STR_KEYS
+        if indent: option |= orjson.OPT_INDENT_2
+        if sort_keys: option |= orjson.OPT_SORT_KEYS
+        return orjson.dumps(obj, default=_default, option=option).decode('utf-8')
+    if backend == 'ujson':
+        return ujson.dumps(obj, ensure_ascii=False, indent=indent or 0, sort_keys=sort_keys,
+                           default=_default)
+    separators = (',', ':') if indent is None else None
+    return json.dumps(obj, ensure_ascii=False, indent=indent, sort_keys=sort_keys,
+                      separators=separators, default=_default)
+
+def dump(obj, fp, indent=None, sort_keys=False):
+    """Writes obj to the text file object fp, compact unless indent is given."""
+    fp.write(dumps(obj, indent=indent, sort_keys=sort_keys))